@@ -1,51 +1,357 @@
 print("🚀 路径3 - 自动化系统开发（优化版）")
 
 # ===== 缓存优化添加 =====
+import copy
 import functools
 import time
 import hashlib
+import inspect
+import math
+import os
+import pickle
+import sqlite3
+import sys
+import heapq
+import threading
+from collections import OrderedDict, deque
+from types import SimpleNamespace
 
-class PerformanceCache:
-    """性能缓存系统"""
-    def __init__(self):
-        self._cache = {}
+_MISSING = object()
+
+def _estimate_size(value):
+    """估算缓存值占用的字节数"""
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+class MemoryCacheBackend:
+    """进程内缓存后端：有界 LRU + TTL，线程安全"""
+    name = 'memory'
     
-    def get(self, key):
-        if key in self._cache:
-            data = self._cache[key]
-            if time.time() < data['expires']:
-                return data['value']
-        return None
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024, default_ttl=300):
+        self._cache = OrderedDict()  # key -> (value, expires, size)
+        self._counters = {}          # 计数器（如产品版本号），不参与LRU淘汰
+        self._lock = threading.RLock()
+        self._bytes = 0
+        self._sets_since_purge = 0
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def _remove_locked(self, key):
+        _, _, size = self._cache.pop(key)
+        self._bytes -= size
+    
+    def _purge_expired_locked(self, now):
+        expired = [key for key, (_, expires, _) in self._cache.items() if expires <= now]
+        for key in expired:
+            self._remove_locked(key)
+        self.expirations += len(expired)
+        self._sets_since_purge = 0
+    
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                if time.time() < entry[1]:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._remove_locked(key)
+                self.expirations += 1
+            self.misses += 1
+            return default
+    
+    def set(self, key, value, ttl=None):
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return  # 单个值超过上限，不缓存
+        now = time.time()
+        expires = now + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._cache:
+                self._remove_locked(key)
+            self._cache[key] = (value, expires, size)
+            self._bytes += size
+            
+            # 定期清理过期条目，避免长驻进程中过期数据堆积
+            self._sets_since_purge += 1
+            if self._sets_since_purge >= 256:
+                self._purge_expired_locked(now)
+            
+            # LRU淘汰，直到满足条目数和字节数上限
+            while len(self._cache) > self.max_entries or self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._cache))
+                self._remove_locked(oldest_key)
+                self.evictions += 1
+    
+    def delete(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._remove_locked(key)
+                return True
+            return False
+    
+    def invalidate(self, prefix=''):
+        """删除所有以prefix开头的缓存键，返回删除数量"""
+        with self._lock:
+            keys = [key for key in self._cache if key.startswith(prefix)]
+            for key in keys:
+                self._remove_locked(key)
+            return len(keys)
+    
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
+    
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+    
+    def get_counter(self, key):
+        return self._counters.get(key, 0)
+    
+    def stats(self):
+        """缓存命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': self.name,
+                'entries': len(self._cache),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+class SQLiteCacheBackend:
+    """基于SQLite文件的共享缓存后端，同一主机上的多个gunicorn worker共用缓存和失效
+    
+    命中/未命中/淘汰计数为当前进程的统计；条目数和字节数为共享存储的实际值。
+    容量上限每64次写入检查一次，属于软上限。
+    命中时只有在 last_access 早于 touch_interval 秒前才更新，避免每次读取都抢占SQLite写锁，
+    因此LRU淘汰顺序的精度为 touch_interval 秒。
+    """
+    name = 'sqlite'
+    
+    def __init__(self, path, max_entries=1024, max_bytes=32 * 1024 * 1024, default_ttl=300, touch_interval=60):
+        self.path = path
+        self.touch_interval = touch_interval
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._sets_since_purge = 0
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_entries ('
+                         'key TEXT PRIMARY KEY, value BLOB, expires REAL, size INTEGER, last_access REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_entries_last_access ON cache_entries (last_access)')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_counters (key TEXT PRIMARY KEY, value INTEGER)')
+    
+    def _connect(self):
+        """每个线程（及fork后的子进程）使用独立连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+    
+    @staticmethod
+    def _like_prefix(prefix):
+        return prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    
+    def get(self, key, default=None):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute('SELECT value, expires, last_access FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            if now < row[1]:
+                if now - row[2] >= self.touch_interval:
+                    with conn:
+                        conn.execute('UPDATE cache_entries SET last_access = ? WHERE key = ?', (now, key))
+                self.hits += 1
+                return pickle.loads(row[0])
+            with conn:
+                conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+            self.expirations += 1
+        self.misses += 1
+        return default
+    
+    def set(self, key, value, ttl=None):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return  # 单个值超过上限，不缓存
+        now = time.time()
+        expires = now + (self.default_ttl if ttl is None else ttl)
+        conn = self._connect()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO cache_entries (key, value, expires, size, last_access) '
+                         'VALUES (?, ?, ?, ?, ?)', (key, blob, expires, len(blob), now))
+        self._sets_since_purge += 1
+        if self._sets_since_purge >= 64:
+            self._enforce_limits(now)
+    
+    def _enforce_limits(self, now):
+        """清理过期条目，并按最近访问时间淘汰超出上限的条目"""
+        self._sets_since_purge = 0
+        conn = self._connect()
+        with conn:
+            self.expirations += conn.execute('DELETE FROM cache_entries WHERE expires <= ?', (now,)).rowcount
+            entries, total_bytes = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries').fetchone()
+            while entries > self.max_entries or total_bytes > self.max_bytes:
+                batch = max(entries - self.max_entries, 1)
+                removed = conn.execute(
+                    'DELETE FROM cache_entries WHERE key IN '
+                    '(SELECT key FROM cache_entries ORDER BY last_access LIMIT ?)', (batch,)).rowcount
+                if not removed:
+                    break
+                self.evictions += removed
+                entries, total_bytes = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries').fetchone()
+    
+    def delete(self, key):
+        conn = self._connect()
+        with conn:
+            return conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,)).rowcount > 0
+    
+    def invalidate(self, prefix=''):
+        conn = self._connect()
+        with conn:
+            return conn.execute("DELETE FROM cache_entries WHERE key LIKE ? ESCAPE '\\'",
+                                (self._like_prefix(prefix),)).rowcount
+    
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM cache_entries')
     
-    def set(self, key, value, ttl=300):
-        self._cache[key] = {
-            'value': value,
-            'expires': time.time() + ttl
+    def incr(self, key):
+        conn = self._connect()
+        with conn:
+            conn.execute('INSERT INTO cache_counters (key, value) VALUES (?, 1) '
+                         'ON CONFLICT(key) DO UPDATE SET value = value + 1', (key,))
+            return conn.execute('SELECT value FROM cache_counters WHERE key = ?', (key,)).fetchone()[0]
+    
+    def get_counter(self, key):
+        row = self._connect().execute('SELECT value FROM cache_counters WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else 0
+    
+    def stats(self):
+        entries, total_bytes = self._connect().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries').fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.name,
+            'path': self.path,
+            'entries': entries,
+            'bytes': total_bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations
         }
 
-performance_cache = PerformanceCache()
+class PerformanceCache:
+    """性能缓存入口，实际存储委托给可替换的后端（memory / sqlite）"""
+    def __init__(self, backend):
+        self.backend = backend
+    
+    def use_backend(self, backend):
+        self.backend = backend
+    
+    def get(self, key, default=None):
+        return self.backend.get(key, default)
+    
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl)
+    
+    def delete(self, key):
+        return self.backend.delete(key)
+    
+    def invalidate(self, prefix=''):
+        return self.backend.invalidate(prefix)
+    
+    def clear(self):
+        self.backend.clear()
+    
+    def incr(self, key):
+        return self.backend.incr(key)
+    
+    def get_counter(self, key):
+        return self.backend.get_counter(key)
+    
+    def stats(self):
+        return self.backend.stats()
+
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES') or 1024)
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES') or 32 * 1024 * 1024)
+performance_cache = PerformanceCache(MemoryCacheBackend(max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES))
+
+def _stable_repr(obj):
+    """生成与内存地址、字典顺序无关的参数表示，用于缓存键"""
+    if isinstance(obj, dict):
+        items = sorted((_stable_repr(k), _stable_repr(v)) for k, v in obj.items())
+        return '{' + ','.join(f'{k}:{v}' for k, v in items) + '}'
+    if isinstance(obj, (list, tuple)):
+        return '[' + ','.join(_stable_repr(item) for item in obj) + ']'
+    if isinstance(obj, (set, frozenset)):
+        return '{' + ','.join(sorted(_stable_repr(item) for item in obj)) + '}'
+    if hasattr(obj, 'item') and callable(obj.item) and getattr(obj, 'ndim', None) == 0:
+        obj = obj.item()  # numpy标量
+    elif hasattr(obj, 'to_dict') and callable(obj.to_dict):
+        return _stable_repr(obj.to_dict())  # pandas Series等
+    return f'{type(obj).__name__}:{obj!r}'
 
-def cached(ttl=300):
-    """缓存装饰器"""
+def make_cache_key(prefix, args=(), kwargs=None):
+    """根据完整的位置参数和关键字参数生成稳定缓存键"""
+    payload = _stable_repr(list(args)) + '|' + _stable_repr(kwargs or {})
+    return f"{prefix}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+def cached(ttl=300, key_prefix=None):
+    """缓存装饰器，键前缀默认为 模块.函数名，可用 performance_cache.invalidate(前缀) 失效"""
     def decorator(func):
+        prefix = key_prefix or f'{func.__module__}.{func.__qualname__}'
+        params = list(inspect.signature(func).parameters)
+        skip_first = bool(params) and params[0] in ('self', 'cls')
+        
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            # 生成缓存键
-            key_parts = [func.__module__, func.__name__]
-            if args:
-                start_index = 1 if args and hasattr(args[0], '__class__') else 0
-                key_parts.extend(str(arg) for arg in args[start_index:start_index+2])
-            cache_key = hashlib.md5('|'.join(key_parts).encode()).hexdigest()
+            # 生成缓存键（方法调用忽略self，使不同实例共享缓存）
+            cache_key = make_cache_key(prefix, args[1:] if skip_first else args, kwargs)
             
             # 检查缓存
-            cached_result = performance_cache.get(cache_key)
-            if cached_result is not None:
+            cached_result = performance_cache.get(cache_key, _MISSING)
+            if cached_result is not _MISSING:
                 return cached_result
             
             # 执行函数并缓存
             result = func(*args, **kwargs)
             performance_cache.set(cache_key, result, ttl)
             return result
+        wrapper.cache_prefix = prefix
         return wrapper
     return decorator
 # ===== 缓存优化结束 =====
@@ -68,7 +374,10 @@ import io
 import base64
 from datetime import datetime, timezone, timedelta
 import json
-from sqlalchemy import or_, text, func
+import zlib
+from sqlalchemy import or_, and_, text, func, case, event, inspect as sa_inspect, update
+from sqlalchemy.exc import IntegrityError
+import click
 import secrets
 import time
 from functools import lru_cache
@@ -77,13 +386,23 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
 import threading
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import glob
+import socket
+import random
+import bisect
+from zoneinfo import ZoneInfo
+
+try:
+    import fcntl  # 启动回填的进程间文件锁（Windows 上不可用，退化为直接执行）
+except ImportError:
+    fcntl = None
 
 # 尝试导入APScheduler，如果失败使用备用方案
 try:
     from apscheduler.schedulers.background import BackgroundScheduler
     from apscheduler.triggers.cron import CronTrigger
+    from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
     APSCHEDULER_AVAILABLE = True
     print("✅ APScheduler 可用")
 except ImportError:
@@ -92,7 +411,7 @@ except ImportError:
 
 # 尝试导入flask-mail，如果失败使用备用方案
 try:
-    from flask_mail import Mail, Message
+    from flask_mail import Mail, Message, Connection as MailConnection
     FLASK_MAIL_AVAILABLE = True
     print("✅ Flask-Mail 可用")
 except ImportError:
@@ -125,8 +444,56 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME') or 'test@example.com'
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD') or 'password'
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER') or 'noreply@example.com'
+    # SMTP套接字超时（秒）：连接、TLS握手与每次读写超过该时间即失败，避免发送卡死占用报告线程
+    MAIL_TIMEOUT = int(os.environ.get('MAIL_TIMEOUT') or 30)
+    
+    # 统计快照缓存时间（秒），产品变更时会立即失效
+    STATS_CACHE_TTL = int(os.environ.get('STATS_CACHE_TTL') or 300)
+    # 统计计算方式：aggregate（内存增量聚合）或 sql（数据库端聚合，不加载产品行）
+    STATS_BACKEND = os.environ.get('STATS_BACKEND') or 'aggregate'
+    
+    # 缓存后端：memory（进程内）或 sqlite（多个worker共享，默认 instance/shared_cache.db）
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or 'memory'
+    CACHE_SQLITE_PATH = os.environ.get('CACHE_SQLITE_PATH')
+    
+    # CSV异步导入：上传文件暂存目录（默认 instance/uploads）与后台线程数
+    IMPORT_UPLOAD_DIR = os.environ.get('IMPORT_UPLOAD_DIR')
+    IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS') or 2)
+    
+    # 定时报告：邮件发送并发线程数与单个用户的发送时限（秒）
+    REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS') or 8)
+    REPORT_USER_TIMEOUT = int(os.environ.get('REPORT_USER_TIMEOUT') or 60)
+    # 周报趋势对比读取的最近日报份数
+    REPORT_TREND_WINDOW = int(os.environ.get('REPORT_TREND_WINDOW') or 7)
+    
+    # 报告保留策略：日报/手动报告保留天数（之后汇总为周汇总），周报与周汇总保留天数（之后汇总为月汇总）
+    REPORT_RETENTION_DAILY_DAYS = int(os.environ.get('REPORT_RETENTION_DAILY_DAYS') or 30)
+    REPORT_RETENTION_WEEKLY_DAYS = int(os.environ.get('REPORT_RETENTION_WEEKLY_DAYS') or 180)
+    REPORT_RETENTION_BATCH_SIZE = int(os.environ.get('REPORT_RETENTION_BATCH_SIZE') or 200)  # 每个事务处理的用户数
+    REPORT_RETENTION_VACUUM = os.environ.get('REPORT_RETENTION_VACUUM', 'true').lower() == 'true'
+    
+    # 持久化后台任务队列：工作线程数、空闲轮询间隔（秒）、最大重试次数、运行超时（秒，超时视为worker已退出）、排队上限
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS') or 2)
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL') or 2)
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS') or 3)
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS') or 600)
+    JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING') or 1000)
+    
+    # 定时任务主节点租约（秒）：多个gunicorn worker中只有持有租约的进程执行定时任务，超时未续约则由其他进程接管
+    SCHEDULER_LEASE_TTL = int(os.environ.get('SCHEDULER_LEASE_TTL') or 60)
+    
+    # 定时任务指标：每个任务保留的最近运行记录数；/metrics 访问令牌（为空则不校验）
+    JOB_METRICS_HISTORY = int(os.environ.get('JOB_METRICS_HISTORY') or 100)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
 
 app.config.from_object(Config)
+
+if app.config['CACHE_BACKEND'] == 'sqlite':
+    performance_cache.use_backend(SQLiteCacheBackend(
+        app.config['CACHE_SQLITE_PATH'] or os.path.join(app.instance_path, 'shared_cache.db'),
+        max_entries=CACHE_MAX_ENTRIES,
+        max_bytes=CACHE_MAX_BYTES
+    ))
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
 db = SQLAlchemy(app)
@@ -134,6 +501,18 @@ db = SQLAlchemy(app)
 # 如果Flask-Mail可用则初始化
 if FLASK_MAIL_AVAILABLE:
     mail = Mail(app)
+    
+    class TimeoutMailConnection(MailConnection):
+        """Flask-Mail创建SMTP连接时不传超时（默认无限阻塞），这里按MAIL_TIMEOUT设置套接字超时"""
+        def configure_host(self):
+            smtp_class = smtplib.SMTP_SSL if self.mail.use_ssl else smtplib.SMTP
+            host = smtp_class(self.mail.server, self.mail.port, timeout=app.config['MAIL_TIMEOUT'])
+            host.set_debuglevel(int(self.mail.debug))
+            if self.mail.use_tls:
+                host.starttls()
+            if self.mail.username and self.mail.password:
+                host.login(self.mail.username, self.mail.password)
+            return host
 else:
     mail = None
 
@@ -155,8 +534,75 @@ def setup_logging():
     app.logger.addHandler(file_handler)
     app.logger.setLevel(logging.INFO)
 
-# 线程池执行器（用于后台任务）
-executor = ThreadPoolExecutor(max_workers=4)
+# CSV导入专用线程池，避免大文件导入占满报告生成线程
+import_executor = ThreadPoolExecutor(max_workers=app.config['IMPORT_WORKERS'])
+# 定时报告邮件发送线程池，单个SMTP发送变慢不会阻塞其他用户
+report_executor = ThreadPoolExecutor(max_workers=app.config['REPORT_WORKERS'])
+
+# 综合评分规则：ROI(40%) + 销量(30%) + 竞争(20%) + 评价(10%)
+ROI_SCORE_THRESHOLDS = [70, 50, 30]          # 从高到低，ROI > 阈值 得对应分
+ROI_SCORE_POINTS = [40, 30, 20, 10]
+SALES_SCORE_BINS = [100, 300, 500]           # 从低到高，供 np.digitize 使用
+SALES_SCORE_POINTS = [8, 15, 22, 30]
+COMPETITION_SCORE_MAP = {'低': 20, '中': 13, '高': 6}
+COMPETITION_SCORE_DEFAULT = 10
+HIGH_VALUE_SCORE = 70
+
+def score_products_vectorized(df):
+    """向量化计算综合评分，一次处理整个DataFrame，返回与df索引对齐的Series"""
+    if df.empty:
+        return pd.Series(dtype=float)
+    
+    # ROI评分 (40%)
+    roi = df['estimated_roi'].to_numpy(dtype=float)
+    roi_score = np.select(
+        [roi > threshold for threshold in ROI_SCORE_THRESHOLDS],
+        ROI_SCORE_POINTS[:-1],
+        default=ROI_SCORE_POINTS[-1]
+    )
+    
+    # 销量评分 (30%)，right=True 保持 "> 阈值" 的原有边界
+    sales = df['monthly_sales'].to_numpy(dtype=float)
+    sales_score = np.asarray(SALES_SCORE_POINTS)[np.digitize(sales, SALES_SCORE_BINS, right=True)]
+    
+    # 竞争评分 (20%)
+    comp_score = df['competition_level'].map(COMPETITION_SCORE_MAP).fillna(COMPETITION_SCORE_DEFAULT).to_numpy(dtype=float)
+    
+    # 评价评分 (10%)
+    rating = pd.to_numeric(df['review_rating'], errors='coerce').to_numpy(dtype=float)
+    review_score = np.nan_to_num(np.clip((rating - 3) * 5, 0, 10))
+    
+    return pd.Series(roi_score + sales_score + comp_score + review_score, index=df.index, name='comprehensive_score')
+
+ROI_DISTRIBUTION_LABELS = ['0-50%', '50-100%', '100-150%', '150-200%', '200%+']
+ROI_DISTRIBUTION_EDGES = [50, 100, 150, 200]
+
+def derive_product_metrics(df):
+    """补充利润、ROI、收益潜力列（与Product.to_dict口径一致）"""
+    if df.empty or 'estimated_roi' in df.columns:
+        return df
+    df = df.copy()
+    price = df['current_price'].astype(float)
+    cost = df['estimated_cost'].astype(float)
+    profit = price - cost
+    df['estimated_profit'] = profit.round(2)
+    df['estimated_roi'] = (profit / cost.where(cost > 0) * 100).fillna(0).round(1)
+    df['revenue_potential'] = price * df['monthly_sales']
+    return df
+
+def fill_missing_derived_metrics(df):
+    """补算派生指标为空的行（尚未回填的旧数据），已存储的值保持不变"""
+    if df.empty or not set(DERIVED_METRIC_COLUMNS) <= set(df.columns):
+        return df
+    missing = df[DERIVED_METRIC_COLUMNS].isna().any(axis=1).to_numpy()
+    if not missing.any():
+        return df
+    rows = derive_product_metrics(df.loc[missing].drop(columns=DERIVED_METRIC_COLUMNS))
+    rows['review_rating'] = pd.to_numeric(rows['review_rating'], errors='coerce').fillna(4.0)
+    rows['comprehensive_score'] = score_products_vectorized(rows)
+    df = df.copy()
+    df.loc[missing, DERIVED_METRIC_COLUMNS] = rows[DERIVED_METRIC_COLUMNS].to_numpy(dtype=float)
+    return df
 
 # 数据库模型
 class User(db.Model):
@@ -178,6 +624,14 @@ class User(db.Model):
         return check_password_hash(self.password_hash, password)
 
 class Product(db.Model):
+    __table_args__ = (
+        db.Index('ix_product_user_name', 'user_id', 'name'),          # 导入查重
+        db.Index('ix_product_user_category', 'user_id', 'category'),  # 按类别筛选
+        db.Index('ix_product_user_score', 'user_id', 'comprehensive_score'),
+        db.Index('ix_product_user_roi', 'user_id', 'estimated_roi'),
+        db.Index('ix_product_user_revenue', 'user_id', 'revenue_potential'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     category = db.Column(db.String(50), nullable=False)
@@ -191,10 +645,29 @@ class Product(db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), 
                           onupdate=lambda: datetime.now(timezone.utc))
+    
+    # 写入时计算的派生指标（评分规则变化后用 flask backfill-metrics --all 重算）
+    estimated_profit = db.Column(db.Float)
+    estimated_roi = db.Column(db.Float)
+    revenue_potential = db.Column(db.Float)
+    comprehensive_score = db.Column(db.Float)
+    
+    def refresh_derived_metrics(self):
+        """按当前评分规则重新计算派生指标"""
+        frame = derive_product_metrics(pd.DataFrame([{
+            'current_price': self.current_price,
+            'estimated_cost': self.estimated_cost,
+            'monthly_sales': self.monthly_sales,
+            'competition_level': self.competition_level,
+            'review_rating': self.review_rating if self.review_rating is not None else 4.0
+        }]))
+        frame['comprehensive_score'] = score_products_vectorized(frame)
+        for column in DERIVED_METRIC_COLUMNS:
+            setattr(self, column, float(frame[column].iloc[0]))
 
     def to_dict(self):
-        estimated_profit = self.current_price - self.estimated_cost
-        estimated_roi = (estimated_profit / self.estimated_cost) * 100 if self.estimated_cost > 0 else 0
+        if self.estimated_roi is None:
+            self.refresh_derived_metrics()
         
         return {
             'id': self.id,
@@ -206,21 +679,157 @@ class Product(db.Model):
             'competition_level': self.competition_level,
             'review_rating': self.review_rating,
             'product_url': self.product_url,
-            'estimated_profit': round(estimated_profit, 2),
-            'estimated_roi': round(estimated_roi, 1),
-            'revenue_potential': self.current_price * self.monthly_sales,
+            'estimated_profit': self.estimated_profit,
+            'estimated_roi': self.estimated_roi,
+            'revenue_potential': self.revenue_potential,
+            'comprehensive_score': self.comprehensive_score,
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M'),
             'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M')
         }
 
+DERIVED_METRIC_COLUMNS = ['estimated_profit', 'estimated_roi', 'revenue_potential', 'comprehensive_score']
+
+@event.listens_for(Product, 'before_insert')
+@event.listens_for(Product, 'before_update')
+def _product_refresh_metrics(mapper, connection, target):
+    target.refresh_derived_metrics()
+
+# 报告摘要指标存为独立列，列表查询无需解码完整数据
+REPORT_SUMMARY_COLUMNS = ['total_products', 'avg_roi', 'high_value_count', 'total_revenue']
+
+def encode_report_payload(data):
+    """完整报告数据压缩存储：紧凑JSON + zlib"""
+    return zlib.compress(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+def decode_report_payload(payload, legacy_data=None):
+    """解码报告数据，兼容尚未迁移的旧版JSON文本"""
+    if payload is not None:
+        return json.loads(zlib.decompress(payload).decode('utf-8'))
+    if legacy_data:
+        return json.loads(legacy_data)
+    return {}
+
 class Report(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     report_type = db.Column(db.String(50), nullable=False)  # daily, weekly, monthly
-    report_data = db.Column(db.Text)  # JSON数据
+    report_data = db.deferred(db.Column(db.Text))  # 旧版JSON数据，迁移到payload后清空
+    payload = db.deferred(db.Column(db.LargeBinary))  # zlib压缩的完整报告数据，打开报告时才加载
+    total_products = db.Column(db.Integer)
+    avg_roi = db.Column(db.Float)
+    high_value_count = db.Column(db.Integer)
+    total_revenue = db.Column(db.Float)
     generated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     sent_via_email = db.Column(db.Boolean, default=False)
     email_sent_at = db.Column(db.DateTime)
+    product_fingerprint = db.Column(db.String(64))  # 生成时的产品集合指纹：数量:最大ID:最近更新时间
+    period = db.Column(db.String(16))  # 汇总报告的周期：2026-W41（周，跨月的周拆为 2026-W44-10 和 2026-W44-11）或 2026-10（月）
+    
+    def set_data(self, data):
+        """写入报告数据：摘要指标入列，完整数据压缩"""
+        for column in REPORT_SUMMARY_COLUMNS:
+            setattr(self, column, data.get(column, 0))
+        self.payload = encode_report_payload(data)
+        self.report_data = None
+    
+    @property
+    def data(self):
+        """完整报告数据（首次访问时解码）"""
+        if not hasattr(self, '_decoded_data'):
+            self._decoded_data = decode_report_payload(self.payload, self.report_data)
+        return self._decoded_data
+
+# 报告列表按用户、生成时间倒序查询
+db.Index('ix_report_user_generated_at', Report.user_id, Report.generated_at.desc())
+
+class ImportJob(db.Model):
+    """CSV导入任务，进度写入数据库以便任意gunicorn worker查询"""
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(200))
+    file_path = db.Column(db.String(500))
+    status = db.Column(db.String(20), default='queued')  # queued, running, completed, failed
+    rows_parsed = db.Column(db.Integer, default=0)
+    rows_inserted = db.Column(db.Integer, default=0)
+    rows_skipped = db.Column(db.Integer, default=0)
+    rows_failed = db.Column(db.Integer, default=0)
+    message = db.Column(db.Text)
+    worker_id = db.Column(db.String(100))  # 执行任务的进程（主机名:pid），任务只存在于该进程的线程池中
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc),
+                           onupdate=lambda: datetime.now(timezone.utc))
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        elapsed = None
+        if self.started_at:
+            elapsed = ((self.finished_at or datetime.now(timezone.utc).replace(tzinfo=None)) - self.started_at.replace(tzinfo=None)).total_seconds()
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'rows_parsed': self.rows_parsed or 0,
+            'rows_inserted': self.rows_inserted or 0,
+            'rows_skipped': self.rows_skipped or 0,
+            'rows_failed': self.rows_failed or 0,
+            'message': self.message,
+            'elapsed_seconds': round(elapsed, 2) if elapsed is not None else None,
+            'rows_per_second': round((self.rows_parsed or 0) / elapsed, 1) if elapsed else None,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None
+        }
+
+class BackgroundJob(db.Model):
+    """持久化后台任务：进程重启后不丢失，相同的排队任务按 dedup_key 合并"""
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    dedup_key = db.Column(db.String(100))
+    payload = db.Column(db.Text)  # JSON参数
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, running, completed, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=3, nullable=False)
+    coalesced_count = db.Column(db.Integer, default=0, nullable=False)  # 被合并的重复请求数
+    locked_by = db.Column(db.String(64))
+    result = db.Column(db.Text)  # JSON结果
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    available_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))  # 重试退避后可再次领取的时间
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_background_job_status_available', 'status', 'available_at'),
+        db.Index('ix_background_job_user_created', 'user_id', 'created_at'),
+        # 每个 dedup_key 最多一个排队中的任务，并发入队时由数据库保证合并
+        db.Index('uq_background_job_pending_dedup', 'dedup_key', unique=True,
+                 sqlite_where=text("status = 'pending'"),
+                 postgresql_where=text("status = 'pending'")),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'job_type': self.job_type,
+            'payload': json.loads(self.payload) if self.payload else {},
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'coalesced_count': self.coalesced_count,
+            'result': json.loads(self.result) if self.result else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S') if self.started_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None
+        }
+
+class SchedulerLease(db.Model):
+    """定时任务主节点租约，每个租约名一行"""
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100))
+    acquired_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime)
 
 # 登录装饰器
 def login_required(f):
@@ -231,101 +840,585 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# 创建数据库表
+def run_lightweight_migrations():
+    """为已有数据库补加新列和索引；只做增量变更，不删除或重建表"""
+    inspector = sa_inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            preparer = db.engine.dialect.identifier_preparer
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(text(
+                        f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column_type}'
+                    ))
+                app.logger.info(f"已为 {table.name} 添加列 {column.name}")
+            except Exception as e:
+                app.logger.warning(f"添加列 {table.name}.{column.name} 失败: {e}")
+    
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=db.engine, checkfirst=True)
+            except Exception as e:
+                app.logger.warning(f"创建索引 {index.name} 失败: {e}")
+
+def backfill_product_metrics(batch_size=1000, only_missing=True):
+    """按id分批重算产品派生指标，返回更新的行数"""
+    updated = 0
+    last_id = 0
+    columns = [Product.id, Product.current_price, Product.estimated_cost, Product.monthly_sales,
+               Product.competition_level, Product.review_rating]
+    while True:
+        query = db.session.query(*columns).filter(Product.id > last_id)
+        if only_missing:
+            query = query.filter(or_(*[getattr(Product, column).is_(None) for column in DERIVED_METRIC_COLUMNS]))
+        rows = query.order_by(Product.id).limit(batch_size).all()
+        if not rows:
+            break
+        
+        frame = derive_product_metrics(pd.DataFrame.from_records(rows, columns=[column.key for column in columns]))
+        frame['review_rating'] = frame['review_rating'].fillna(4.0)
+        frame['comprehensive_score'] = score_products_vectorized(frame)
+        db.session.execute(update(Product), frame[['id'] + DERIVED_METRIC_COLUMNS].to_dict('records'))
+        db.session.commit()
+        
+        updated += len(rows)
+        last_id = int(rows[-1].id)
+    return updated
+
+@app.cli.command('backfill-metrics')
+@click.option('--all', 'recompute_all', is_flag=True, help='重算全部产品（评分规则变化后使用）')
+@click.option('--batch-size', default=1000, show_default=True, help='每批处理的产品数')
+def backfill_metrics_command(recompute_all, batch_size):
+    """重算产品的利润、ROI、收益潜力和综合评分"""
+    updated = backfill_product_metrics(batch_size=batch_size, only_missing=not recompute_all)
+    performance_cache.invalidate('stats:')
+    click.echo(f'✅ 已更新 {updated} 个产品的派生指标')
+
+def backfill_report_payloads(batch_size=500):
+    """把旧版JSON文本报告迁移为摘要列 + 压缩数据，返回迁移的行数"""
+    migrated = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(Report.id, Report.report_data) \
+            .filter(Report.id > last_id, Report.payload.is_(None), Report.report_data.isnot(None)) \
+            .order_by(Report.id).limit(batch_size).all()
+        if not rows:
+            break
+        
+        records = []
+        for report_id, report_data in rows:
+            try:
+                data = json.loads(report_data)
+            except ValueError:
+                app.logger.warning(f"报告 {report_id} 的JSON数据无法解析，跳过迁移")
+                continue
+            record = {column: data.get(column, 0) for column in REPORT_SUMMARY_COLUMNS}
+            record.update(id=report_id, payload=encode_report_payload(data), report_data=None)
+            records.append(record)
+        if records:
+            db.session.execute(update(Report), records)
+            db.session.commit()
+        
+        migrated += len(records)
+        last_id = rows[-1].id
+    return migrated
+
+@app.cli.command('migrate-reports')
+@click.option('--batch-size', default=500, show_default=True, help='每批迁移的报告数')
+def migrate_reports_command(batch_size):
+    """把旧版JSON文本报告迁移为摘要列 + 压缩数据"""
+    migrated = backfill_report_payloads(batch_size=batch_size)
+    click.echo(f'✅ 已迁移 {migrated} 份旧版报告数据')
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def fail_stale_import_jobs():
+    """把所属进程已退出的排队/执行中导入任务标记为失败，并删除暂存文件，返回处理的任务数
+    
+    同一主机上的任务按进程是否存活判断；其他主机（或旧记录）的任务超过 JOB_LEASE_SECONDS 未更新视为已中断。
+    """
+    hostname = socket.gethostname()
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=app.config['JOB_LEASE_SECONDS'])
+    failed = 0
+    for job in ImportJob.query.filter(ImportJob.status.in_(['queued', 'running'])).all():
+        host, _, pid = (job.worker_id or '').rpartition(':')
+        if host == hostname and pid.isdigit():
+            stale = not _process_alive(int(pid))
+        else:
+            stale = (job.updated_at or job.created_at) < cutoff
+        if not stale:
+            continue
+        job.status = 'failed'
+        job.finished_at = datetime.now(timezone.utc)
+        job.message = '导入失败: 服务重启，任务已中断，请重新上传'
+        if job.file_path and os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        failed += 1
+    db.session.commit()
+    return failed
+
+def run_startup_backfill():
+    """启动时补算缺失的派生指标并迁移旧版报告
+    
+    每个gunicorn worker都会导入本模块：用 instance/ 下的文件锁保证同一时间只有一个进程执行，
+    其他进程直接跳过（读取路径会补算尚未回填的行）；失败只记录警告，不影响启动。
+    """
+    os.makedirs(app.instance_path, exist_ok=True)
+    with open(os.path.join(app.instance_path, 'startup_backfill.lock'), 'w') as lock_file:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                app.logger.info("其他进程正在执行启动回填，跳过")
+                return
+        try:
+            backfilled = backfill_product_metrics()
+            if backfilled:
+                app.logger.info(f"已补算 {backfilled} 个产品的派生指标")
+            migrated_reports = backfill_report_payloads()
+            if migrated_reports:
+                app.logger.info(f"已迁移 {migrated_reports} 份旧版报告数据")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"启动回填失败，可稍后执行 flask backfill-metrics / flask migrate-reports: {e}")
+
+# 创建数据库表，并在文件锁保护下回填旧数据
 with app.app_context():
     db.create_all()
+    run_lightweight_migrations()
+    run_startup_backfill()
+    try:
+        stale_imports = fail_stale_import_jobs()
+        if stale_imports:
+            app.logger.warning(f"已将 {stale_imports} 个中断的导入任务标记为失败")
+    except Exception as e:
+        db.session.rollback()
+        app.logger.warning(f"清理中断的导入任务失败: {e}")
+
+# ===== 定时任务执行指标 =====
+
+class JobMetrics:
+    """两种调度器共用的任务执行指标：每个任务一个定长环形缓冲区保存最近运行，另有累计计数"""
+    
+    def __init__(self, history_size=100):
+        self.history_size = history_size
+        self.jobs = {}
+        self.lock = threading.Lock()
+    
+    def _job(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            job = self.jobs[job_id] = {
+                'runs': deque(maxlen=self.history_size),
+                'counts': {'success': 0, 'failed': 0, 'skipped': 0},
+                'duration_sum': 0.0,
+                'rows_total': 0,
+                'last_error': None,
+                'last_run': None
+            }
+        return job
+    
+    def record(self, job_id, status, duration=0.0, rows=None, error=None, started_at=None):
+        started_at = started_at or datetime.now(timezone.utc)
+        with self.lock:
+            job = self._job(job_id)
+            job['counts'][status] += 1
+            job['runs'].append({
+                'started_at': started_at,
+                'duration': duration,
+                'status': status,
+                'rows': rows,
+                'error': error
+            })
+            if status != 'skipped':
+                job['duration_sum'] += duration
+                job['rows_total'] += rows or 0
+                job['last_run'] = started_at
+            if error and status == 'failed':
+                job['last_error'] = error
+    
+    def track(self, job_id, func):
+        """包装任务函数：记录耗时、成功/失败；函数返回整数时作为处理的行数"""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started_at = datetime.now(timezone.utc)
+            start_time = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.record(job_id, 'failed', time.perf_counter() - start_time, error=str(e), started_at=started_at)
+                raise
+            rows = result if isinstance(result, int) and not isinstance(result, bool) else None
+            self.record(job_id, 'success', time.perf_counter() - start_time, rows=rows, started_at=started_at)
+            return result
+        return wrapper
+    
+    @staticmethod
+    def _percentile(sorted_values, quantile):
+        """最近排名法百分位"""
+        if not sorted_values:
+            return None
+        index = max(0, math.ceil(quantile * len(sorted_values)) - 1)
+        return sorted_values[index]
+    
+    def snapshot(self):
+        """各任务的汇总：最近运行的 p50/p95/最大耗时、累计成功/失败/跳过次数、最后错误、处理行数"""
+        with self.lock:
+            jobs = {job_id: (list(job['runs']), dict(job)) for job_id, job in self.jobs.items()}
+        
+        result = {}
+        for job_id, (runs, job) in jobs.items():
+            durations = sorted(run['duration'] for run in runs if run['status'] != 'skipped')
+            last = runs[-1] if runs else None
+            result[job_id] = {
+                'success': job['counts']['success'],
+                'failed': job['counts']['failed'],
+                'skipped': job['counts']['skipped'],
+                'p50_seconds': round(self._percentile(durations, 0.5), 3) if durations else None,
+                'p95_seconds': round(self._percentile(durations, 0.95), 3) if durations else None,
+                'max_seconds': round(durations[-1], 3) if durations else None,
+                'duration_sum_seconds': round(job['duration_sum'], 3),
+                'rows_total': job['rows_total'],
+                'last_rows': next((run['rows'] for run in reversed(runs) if run['rows'] is not None), None),
+                'last_status': last['status'] if last else None,
+                'last_result': next((run['status'] for run in reversed(runs) if run['status'] != 'skipped'), None),
+                'last_run': job['last_run'].strftime('%Y-%m-%d %H:%M:%S') if job['last_run'] else None,
+                'last_error': job['last_error'],
+                'recent_runs': len(runs)
+            }
+        return result
+    
+    def to_prometheus(self):
+        """Prometheus 文本格式"""
+        def label(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        
+        snapshot = self.snapshot()
+        lines = [
+            '# HELP scheduler_job_runs_total 定时任务运行次数（按结果）',
+            '# TYPE scheduler_job_runs_total counter'
+        ]
+        for job_id, stats in snapshot.items():
+            for status in ('success', 'failed', 'skipped'):
+                lines.append(f'scheduler_job_runs_total{{job="{label(job_id)}",status="{status}"}} {stats[status]}')
+        
+        lines += [
+            '# HELP scheduler_job_duration_seconds 定时任务耗时（分位数基于最近运行）',
+            '# TYPE scheduler_job_duration_seconds summary'
+        ]
+        for job_id, stats in snapshot.items():
+            job = label(job_id)
+            for quantile, key in (('0.5', 'p50_seconds'), ('0.95', 'p95_seconds'), ('1', 'max_seconds')):
+                if stats[key] is not None:
+                    lines.append(f'scheduler_job_duration_seconds{{job="{job}",quantile="{quantile}"}} {stats[key]}')
+            lines.append(f'scheduler_job_duration_seconds_sum{{job="{job}"}} {stats["duration_sum_seconds"]}')
+            lines.append(f'scheduler_job_duration_seconds_count{{job="{job}"}} {stats["success"] + stats["failed"]}')
+        
+        lines += [
+            '# HELP scheduler_job_rows_processed_total 定时任务累计处理行数',
+            '# TYPE scheduler_job_rows_processed_total counter'
+        ]
+        for job_id, stats in snapshot.items():
+            lines.append(f'scheduler_job_rows_processed_total{{job="{label(job_id)}"}} {stats["rows_total"]}')
+        
+        lines += [
+            '# HELP scheduler_job_last_success 最近一次运行是否成功',
+            '# TYPE scheduler_job_last_success gauge'
+        ]
+        for job_id, stats in snapshot.items():
+            if stats['last_result']:
+                lines.append(f'scheduler_job_last_success{{job="{label(job_id)}"}} {int(stats["last_result"] == "success")}')
+        return '\n'.join(lines) + '\n'
+
+job_metrics = JobMetrics(app.config['JOB_METRICS_HISTORY'])
+
+class SimpleCronTrigger:
+    """cron触发器：分钟、小时、日、月、星期
+    
+    关键字参数与APScheduler一致：day_of_week 0=周一，日与星期同时指定时需同时满足，
+    未指定的字段中比最低位已指定字段更低的取最小值、其余取 *。
+    标准crontab表达式（如 "0 10 * * 0"）中星期 0/7=周日，日与星期同时限定时满足其一即可。
+    """
+    
+    FIELDS = [('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('day_of_week', 0, 6)]
+    MONTH_NAMES = {name: index + 1 for index, name in enumerate(
+        ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'])}
+    WEEKDAY_NAMES = {name: index for index, name in enumerate(['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun'])}
+    CRONTAB_WEEKDAY_NAMES = {name: (index + 1) % 7 for name, index in WEEKDAY_NAMES.items()}
+    MAX_SEARCH_DAYS = 366 * 8  # 足够覆盖 2月29日 这类稀疏规则
+    
+    def __init__(self, minute='*', hour='*', day='*', month='*', day_of_week='*', timezone_name='UTC',
+                 day_or=False, crontab=False):
+        weekday_names = self.CRONTAB_WEEKDAY_NAMES if crontab else self.WEEKDAY_NAMES
+        self.specs = {'minute': minute, 'hour': hour, 'day': day, 'month': month, 'day_of_week': day_of_week}
+        self.minutes = self._parse_field(minute, 0, 59)
+        self.hours = self._parse_field(hour, 0, 23)
+        self.days = set(self._parse_field(day, 1, 31))
+        self.months = set(self._parse_field(month, 1, 12, self.MONTH_NAMES))
+        if crontab:
+            # crontab 星期 0/7=周日，转换为 date.weekday() 的 0=周一
+            self.weekdays = {(value - 1) % 7 for value in self._parse_field(day_of_week, 0, 7, weekday_names)}
+        else:
+            self.weekdays = set(self._parse_field(day_of_week, 0, 6, weekday_names))
+        self.day_or = day_or and str(day) not in ('*', '?') and str(day_of_week) not in ('*', '?')
+        self.timezone = ZoneInfo(timezone_name) if isinstance(timezone_name, str) else timezone_name
+        self._cache = None  # (查询起点, 结果)：起点落在 [起点, 结果) 内的查询直接复用
+    
+    @classmethod
+    def from_kwargs(cls, expression=None, timezone=None, **kwargs):
+        """从 add_job 的关键字参数构造；expression 为标准crontab五段表达式"""
+        timezone_name = timezone or 'UTC'
+        if expression:
+            parts = expression.split()
+            if len(parts) != 5:
+                raise ValueError(f"cron表达式需要5个字段: {expression}")
+            minute, hour, day, month, day_of_week = parts
+            return cls(minute, hour, day, month, day_of_week, timezone_name, day_or=True, crontab=True)
+        
+        unknown = set(kwargs) - {name for name, _, _ in cls.FIELDS}
+        if unknown:
+            raise ValueError(f"不支持的cron字段: {', '.join(sorted(unknown))}")
+        # 与APScheduler相同：比最低位已指定字段更低的字段取最小值（星期除外），其余取 *
+        defaults = {'month': 1, 'day': 1, 'day_of_week': '*', 'hour': 0, 'minute': 0}
+        remaining = set(kwargs)
+        fields = {}
+        for name in ('month', 'day', 'day_of_week', 'hour', 'minute'):
+            if name in kwargs:
+                fields[name] = kwargs[name]
+                remaining.discard(name)
+            else:
+                fields[name] = defaults[name] if kwargs and not remaining else '*'
+        return cls(timezone_name=timezone_name, **fields)
+    
+    @staticmethod
+    def _parse_value(token, names):
+        token = token.strip().lower()
+        if names and token in names:
+            return names[token]
+        return int(token)
+    
+    @classmethod
+    def _parse_field(cls, spec, low, high, names=None):
+        """解析单个字段：* ? a a-b */n a-b/n a/n 及逗号组合，返回排序后的取值列表"""
+        values = set()
+        for part in str(spec).split(','):
+            step = None
+            if '/' in part:
+                part, step_text = part.split('/', 1)
+                step = int(step_text)
+                if step <= 0:
+                    raise ValueError(f"cron步长必须为正数: {spec}")
+            part = part.strip()
+            if part in ('*', '?'):
+                start, end = low, high
+            elif '-' in part:
+                start_text, end_text = part.split('-', 1)
+                start, end = cls._parse_value(start_text, names), cls._parse_value(end_text, names)
+            else:
+                start = cls._parse_value(part, names)
+                end = high if step else start
+            if not low <= start <= end <= high:
+                raise ValueError(f"cron字段超出范围 {low}-{high}: {spec}")
+            values.update(range(start, end + 1, step or 1))
+        return sorted(values)
+    
+    def _day_matches(self, day):
+        if day.month not in self.months:
+            return False
+        day_match = day.day in self.days
+        weekday_match = day.weekday() in self.weekdays
+        return (day_match or weekday_match) if self.day_or else (day_match and weekday_match)
+    
+    def next_fire_time(self, after):
+        """返回严格晚于 after 的下一次触发时间（UTC）"""
+        if self._cache and self._cache[0] <= after < self._cache[1]:
+            return self._cache[1]
+        
+        local = after.astimezone(self.timezone).replace(second=0, microsecond=0, tzinfo=None) + timedelta(minutes=1)
+        day = local.date()
+        for _ in range(self.MAX_SEARCH_DAYS):
+            if self._day_matches(day):
+                first_day = day == local.date()
+                hour_index = bisect.bisect_left(self.hours, local.hour) if first_day else 0
+                for hour in self.hours[hour_index:]:
+                    minute_index = bisect.bisect_left(self.minutes, local.minute) if first_day and hour == local.hour else 0
+                    for minute in self.minutes[minute_index:]:
+                        naive = datetime(day.year, day.month, day.day, hour, minute)
+                        candidate = naive.replace(tzinfo=self.timezone)
+                        # 夏令时跳过的本地时间不存在，往返转换后会变化
+                        if candidate.astimezone(timezone.utc).astimezone(self.timezone).replace(tzinfo=None) != naive:
+                            continue
+                        result = candidate.astimezone(timezone.utc)
+                        self._cache = (after, result)
+                        return result
+            day += timedelta(days=1)
+        raise ValueError(f"cron规则在 {self.MAX_SEARCH_DAYS} 天内没有触发时间: {self}")
+    
+    def __str__(self):
+        fields = ' '.join(f"{name}={value}" for name, value in self.specs.items() if str(value) != '*')
+        return f"cron[{fields}] {self.timezone}"
 
 # 简单的定时任务管理器（如果APScheduler不可用）
 class SimpleScheduler:
-    def __init__(self):
+    """事件驱动的定时器：最小堆保存下次运行时间，调度线程只睡到最近的到期任务，任务交给线程池执行"""
+    
+    def __init__(self, max_workers=4):
         self.tasks = []
+        self.tasks_by_id = {}
+        self.heap = []  # (下次运行时间戳, 序号, 任务ID)
+        self.sequence = 0
+        self.condition = threading.Condition()
         self.running = False
         self.thread = None
-        self.task_history = []
-    
-    def add_job(self, func, trigger_type='interval', **kwargs):
-        """添加定时任务"""
-        task_id = f"task_{len(self.tasks) + 1}"
-        task = {
-            'id': task_id,
-            'func': func,
-            'trigger_type': trigger_type,
-            'kwargs': kwargs,
-            'last_run': None,
-            'next_run': None,
-            'enabled': True
-        }
-        self.tasks.append(task)
-        self._calculate_next_run(task)
+        self.max_workers = max_workers
+        self.pool = None
+    
+    def add_job(self, func, trigger_type='interval', max_instances=1, misfire_policy='coalesce',
+                misfire_grace_time=60, jitter=0, id=None, name=None, **kwargs):
+        """添加定时任务
+        
+        cron任务参数：minute/hour/day/month/day_of_week/timezone（同APScheduler），或 expression='0 9 * * *'
+        max_instances: 同一任务同时运行的最大实例数，超出时本次运行跳过
+        misfire_policy: 错过运行时间超过 misfire_grace_time 秒时的处理，coalesce（合并为一次补跑）或 skip（跳过）
+        jitter: 每次运行随机推迟 0~jitter 秒，避免多个任务同时触发
+        id/name: 任务标识与名称（同APScheduler），执行指标按 id 记录
+        """
+        if misfire_policy not in ('coalesce', 'skip'):
+            raise ValueError(f"不支持的misfire_policy: {misfire_policy}")
+        trigger = SimpleCronTrigger.from_kwargs(**kwargs) if trigger_type == 'cron' else None
+        
+        with self.condition:
+            task_id = id or f"task_{len(self.tasks) + 1}"
+            task = {
+                'id': task_id,
+                'name': name or task_id,
+                'func': func,
+                'trigger_type': trigger_type,
+                'kwargs': kwargs,
+                'trigger': trigger,
+                'jitter': jitter,
+                'last_run': None,
+                'planned_run': None,
+                'next_run': None,
+                'enabled': True,
+                'max_instances': max_instances,
+                'misfire_policy': misfire_policy,
+                'misfire_grace_time': misfire_grace_time,
+                'running': 0,
+                'skipped_runs': 0
+            }
+            self.tasks.append(task)
+            self.tasks_by_id[task_id] = task
+            self._schedule(task, datetime.now(timezone.utc))
+            self.condition.notify()
         return task_id
     
-    def _calculate_next_run(self, task):
-        """计算下次运行时间"""
-        now = datetime.now(timezone.utc)
+    def _interval(self, task):
+        kwargs = task['kwargs']
+        seconds = kwargs.get('seconds', 0) + kwargs.get('minutes', 0) * 60 + kwargs.get('hours', 0) * 3600
+        return timedelta(seconds=seconds or 5 * 60)
+    
+    def _calculate_next_run(self, task, now, scheduled=None):
+        """计算 now 之后的下次运行时间；间隔任务按原计划时间对齐，错过的多次运行只保留一次"""
         if task['trigger_type'] == 'interval':
-            interval = task['kwargs'].get('minutes', 5)
-            if task['last_run']:
-                task['next_run'] = task['last_run'] + timedelta(minutes=interval)
-            else:
-                task['next_run'] = now + timedelta(minutes=interval)
+            interval = self._interval(task)
+            if scheduled is None:
+                return now + interval
+            missed = (now - scheduled) // interval
+            return scheduled + interval * (missed + 1)
         elif task['trigger_type'] == 'cron':
-            hour = task['kwargs'].get('hour', 9)
-            minute = task['kwargs'].get('minute', 0)
-            today = now.date()
-            next_run = datetime(today.year, today.month, today.day, hour, minute, tzinfo=timezone.utc)
-            if next_run <= now:
-                next_run += timedelta(days=1)
-            task['next_run'] = next_run
+            return task['trigger'].next_fire_time(now)
+        raise ValueError(f"不支持的触发器类型: {task['trigger_type']}")
+    
+    def _schedule(self, task, now, planned=None):
+        """预先计算下次运行时间（计划时间 + 随机抖动）并放入堆"""
+        task['planned_run'] = self._calculate_next_run(task, now, planned)
+        jitter = random.uniform(0, task['jitter']) if task['jitter'] else 0
+        task['next_run'] = task['planned_run'] + timedelta(seconds=jitter)
+        self._push(task)
+    
+    def _push(self, task):
+        self.sequence += 1
+        heapq.heappush(self.heap, (task['next_run'].timestamp(), self.sequence, task['id']))
     
     def start(self):
         """启动定时任务"""
-        self.running = True
-        self.thread = threading.Thread(target=self._run_scheduler)
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+            self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='scheduler-job')
+        self.thread = threading.Thread(target=self._run_scheduler, name='scheduler')
         self.thread.daemon = True
         self.thread.start()
         print("✅ 优化版定时器启动")
     
     def _run_scheduler(self):
-        """运行调度器"""
-        while self.running:
-            now = datetime.now(timezone.utc)
-            
-            for task in self.tasks:
-                if not task['enabled']:
+        """运行调度器：等待到堆顶任务到期（新增任务或关闭时被唤醒）"""
+        with self.condition:
+            while self.running:
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                
+                due, _, task_id = self.heap[0]
+                delay = due - time.time()
+                if delay > 0:
+                    self.condition.wait(delay)
                     continue
-                    
-                if task['next_run'] and now >= task['next_run']:
-                    try:
-                        start_time = time.time()
-                        task['func']()
-                        execution_time = round(time.time() - start_time, 2)
-                        
-                        # 记录执行历史
-                        self.task_history.append({
-                            'task_id': task['id'],
-                            'executed_at': now,
-                            'execution_time': execution_time,
-                            'status': 'success'
-                        })
-                        
-                        task['last_run'] = now
-                        self._calculate_next_run(task)
-                        
-                    except Exception as e:
-                        app.logger.error(f"定时任务执行失败: {e}")
-                        self.task_history.append({
-                            'task_id': task['id'],
-                            'executed_at': now,
-                            'execution_time': 0,
-                            'status': 'failed',
-                            'error': str(e)
-                        })
-            
-            # 保留最近100条执行记录
-            if len(self.task_history) > 100:
-                self.task_history = self.task_history[-100:]
                 
-            time.sleep(30)  # 每30秒检查一次
+                heapq.heappop(self.heap)
+                task = self.tasks_by_id[task_id]
+                if task['enabled'] and task['next_run'].timestamp() == due:
+                    self._dispatch(task)
+    
+    def _dispatch(self, task):
+        """到期任务：按错过策略和并发上限决定是否执行，并安排下一次"""
+        now = datetime.now(timezone.utc)
+        scheduled = task['next_run']
+        lateness = (now - scheduled).total_seconds()
+        
+        skip_reason = None
+        if lateness > task['misfire_grace_time'] and task['misfire_policy'] == 'skip':
+            skip_reason = f"错过计划时间 {round(lateness)} 秒"
+        elif task['running'] >= task['max_instances']:
+            skip_reason = f"已有 {task['running']} 个实例在运行"
+        
+        if skip_reason:
+            task['skipped_runs'] += 1
+            job_metrics.record(task['id'], 'skipped', error=skip_reason, started_at=scheduled)
+            app.logger.warning(f"定时任务 {task['id']} 本次跳过: {skip_reason}")
+        else:
+            task['running'] += 1
+            task['last_run'] = now
+            self.pool.submit(self._execute, task, scheduled)
+        
+        self._schedule(task, now, task['planned_run'])
+    
+    def _execute(self, task, scheduled):
+        """执行任务（耗时与结果由注册时的 job_metrics.track 包装记录）"""
+        try:
+            task['func']()
+        except Exception as e:
+            app.logger.error(f"定时任务 {task['id']} 执行失败: {e}")
+        finally:
+            with self.condition:
+                task['running'] -= 1
     
     def get_task_status(self):
         """获取任务状态"""
@@ -333,18 +1426,28 @@ class SimpleScheduler:
         for task in self.tasks:
             status.append({
                 'id': task['id'],
+                'name': task['name'],
                 'trigger_type': task['trigger_type'],
+                'trigger': str(task['trigger']) if task['trigger'] else f"interval[{self._interval(task)}]",
                 'last_run': task['last_run'].strftime('%Y-%m-%d %H:%M:%S') if task['last_run'] else '从未运行',
                 'next_run': task['next_run'].strftime('%Y-%m-%d %H:%M:%S') if task['next_run'] else '未知',
-                'enabled': task['enabled']
+                'enabled': task['enabled'],
+                'running': task['running'],
+                'max_instances': task['max_instances'],
+                'misfire_policy': task['misfire_policy'],
+                'skipped_runs': task['skipped_runs']
             })
         return status
     
     def shutdown(self):
         """关闭调度器"""
-        self.running = False
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
         if self.thread:
             self.thread.join(timeout=5)
+        if self.pool:
+            self.pool.shutdown(wait=False)
 
 # 初始化任务调度器
 if APSCHEDULER_AVAILABLE:
@@ -354,47 +1457,105 @@ else:
     scheduler = SimpleScheduler()
     print("✅ 使用优化版定时器")
 
-class AutomationProductAnalyzer:
-    def __init__(self, products):
-        self.df = pd.DataFrame([p.to_dict() for p in products]) if products else pd.DataFrame()
-        self.app_logger = app.logger
+class ProductAggregates:
+    """单个用户产品的累加聚合，支持增量插入，输出与get_detailed_stats相同结构"""
+    def __init__(self, version=0):
+        self.version = version
+        self.count = 0
+        self.roi_tenths = 0            # ROI已取一位小数，按0.1为单位用整数累加，避免增量与重建的浮点误差
+        self.profit_cents = 0          # 单件利润已取两位小数，按分累加
+        self.raw_profit_sum = 0.0      # 未取整的价格-成本累加
+        self.revenue_sum = 0.0
+        self.sales_sum = 0
+        self.margin_sum = 0.0
+        self.margin_count = 0
+        self.high_value_count = 0
+        self.categories = {}           # 类别 -> {count, roi_sum, profit_sum, revenue_sum}
+        self.roi_buckets = [0] * len(ROI_DISTRIBUTION_LABELS)
+        self.trends = {'high_roi_products': 0, 'high_sales_products': 0,
+                       'low_competition_products': 0, 'high_profit_products': 0}
+        self.best_roi = None
+        self.best_name = None
+        self.max_id = 0                # 已累加的最大产品id（由列式缓存构建时设置），增量更新只累加更大id的行
     
-    @cached(ttl=600)  # 缓存10分钟
-    def calculate_comprehensive_score(self, product_dict):
-        """计算综合评分"""
-        try:
-            score = 0
-            
-            # ROI评分 (40%)
-            roi = product_dict['estimated_roi']
-            if roi > 70: score += 40
-            elif roi > 50: score += 30
-            elif roi > 30: score += 20
-            else: score += 10
-            
-            # 销量评分 (30%)
-            sales = product_dict['monthly_sales']
-            if sales > 500: score += 30
-            elif sales > 300: score += 22
-            elif sales > 100: score += 15
-            else: score += 8
-            
-            # 竞争评分 (20%)
-            comp_mapping = {'低': 20, '中': 13, '高': 6}
-            score += comp_mapping.get(product_dict['competition_level'], 10)
-            
-            # 评价评分 (10%)
-            review_score = (product_dict['review_rating'] - 3) * 5
-            score += max(0, min(10, review_score))
-            
-            return score
-        except Exception as e:
-            self.app_logger.error(f'计算综合评分失败: {e}')
-            return 0
+    @classmethod
+    def from_frame(cls, df, scores=None, version=0):
+        aggregates = cls(version)
+        aggregates.add_frame(df, scores)
+        return aggregates
     
-    def get_detailed_stats(self):
-        """获取详细统计数据"""
-        if self.df.empty:
+    def copy(self, version=None):
+        """复制累加状态（类别和趋势字典为可变对象，需要逐层复制）"""
+        aggregates = copy.copy(self)
+        aggregates.categories = {category: dict(bucket) for category, bucket in self.categories.items()}
+        aggregates.roi_buckets = list(self.roi_buckets)
+        aggregates.trends = dict(self.trends)
+        if version is not None:
+            aggregates.version = version
+        return aggregates
+    
+    def add_frame(self, df, scores=None):
+        """累加一批产品（DataFrame），只做向量化运算
+        
+        会原地修改实例，已发布到AggregateStore的实例应先copy()
+        """
+        if df.empty:
+            return
+        df = derive_product_metrics(df)
+        if scores is None:
+            scores = score_products_vectorized(df)
+        
+        roi = df['estimated_roi'].to_numpy(dtype=float)
+        price = df['current_price'].to_numpy(dtype=float)
+        raw_profit = price - df['estimated_cost'].to_numpy(dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            margin = raw_profit / price * 100
+        margin = margin[np.isfinite(margin)]
+        
+        self.count += len(df)
+        self.roi_tenths += int(np.rint(roi * 10).sum())
+        self.profit_cents += int(np.rint(df['estimated_profit'].to_numpy(dtype=float) * 100).sum())
+        self.raw_profit_sum += float(raw_profit.sum())
+        self.revenue_sum += float(df['revenue_potential'].sum())
+        self.sales_sum += int(df['monthly_sales'].sum())
+        self.margin_sum += float(margin.sum())
+        self.margin_count += len(margin)
+        self.high_value_count += int((np.asarray(scores) >= HIGH_VALUE_SCORE).sum())
+        
+        # ROI分布
+        buckets = np.bincount(np.digitize(roi, ROI_DISTRIBUTION_EDGES, right=True),
+                              minlength=len(ROI_DISTRIBUTION_LABELS))
+        self.roi_buckets = [int(a + b) for a, b in zip(self.roi_buckets, buckets)]
+        
+        # 趋势计数
+        self.trends['high_roi_products'] += int((roi > 100).sum())
+        self.trends['high_sales_products'] += int((df['monthly_sales'] > 300).sum())
+        self.trends['low_competition_products'] += int((df['competition_level'] == '低').sum())
+        self.trends['high_profit_products'] += int((df['estimated_profit'] > 20).sum())
+        
+        # 类别分组（一次groupby）
+        grouped = df.groupby('category', sort=False).agg(
+            count=('estimated_roi', 'size'),
+            roi_sum=('estimated_roi', 'sum'),
+            profit_sum=('estimated_profit', 'sum'),
+            revenue_sum=('revenue_potential', 'sum')
+        )
+        for category, row in grouped.iterrows():
+            bucket = self.categories.setdefault(category, {'count': 0, 'roi_sum': 0.0, 'profit_sum': 0.0, 'revenue_sum': 0.0})
+            bucket['count'] += int(row['count'])
+            bucket['roi_sum'] += float(row['roi_sum'])
+            bucket['profit_sum'] += float(row['profit_sum'])
+            bucket['revenue_sum'] += float(row['revenue_sum'])
+        
+        # 最佳ROI产品（相同ROI保留先插入的）
+        best_index = int(roi.argmax())
+        if self.best_roi is None or roi[best_index] > self.best_roi:
+            self.best_roi = float(roi[best_index])
+            self.best_name = df['name'].iloc[best_index]
+    
+    def to_stats(self):
+        """输出统计结果，耗时只与类别数量相关"""
+        if self.count == 0:
             return {
                 'total_products': 0,
                 'avg_roi': 0,
@@ -409,85 +1570,388 @@ class AutomationProductAnalyzer:
                 'sales_analysis': {}
             }
         
-        total_products = len(self.df)
-        avg_roi = float(self.df['estimated_roi'].mean())
-        avg_profit = float(self.df['estimated_profit'].mean())
-        total_revenue = float(self.df['revenue_potential'].sum())
-        
-        # 计算高价值产品数量
-        high_value_count = 0
-        for _, product in self.df.iterrows():
-            score = self.calculate_comprehensive_score(product.to_dict())
-            if score >= 70:
-                high_value_count += 1
-        
-        # 找到最佳产品
-        best_product_row = self.df.loc[self.df['estimated_roi'].idxmax()] if not self.df.empty else None
-        best_product = best_product_row['name'] if best_product_row is not None else '暂无数据'
-        
-        # 类别分析
-        category_breakdown = {}
-        for category in self.df['category'].unique():
-            category_data = self.df[self.df['category'] == category]
-            category_breakdown[category] = {
-                'count': len(category_data),
-                'avg_roi': float(category_data['estimated_roi'].mean()),
-                'avg_profit': float(category_data['estimated_profit'].mean()),
-                'total_revenue': float(category_data['revenue_potential'].sum())
+        category_breakdown = {
+            category: {
+                'count': bucket['count'],
+                'avg_roi': bucket['roi_sum'] / bucket['count'],
+                'avg_profit': bucket['profit_sum'] / bucket['count'],
+                'total_revenue': bucket['revenue_sum']
             }
+            for category, bucket in self.categories.items() if bucket['count']
+        }
+        avg_sales = self.sales_sum / self.count
         
-        # ROI分布
-        roi_ranges = ['0-50%', '50-100%', '100-150%', '150-200%', '200%+']
-        roi_counts = [0, 0, 0, 0, 0]
-        
-        for roi in self.df['estimated_roi']:
-            if roi <= 50:
-                roi_counts[0] += 1
-            elif roi <= 100:
-                roi_counts[1] += 1
-            elif roi <= 150:
-                roi_counts[2] += 1
-            elif roi <= 200:
-                roi_counts[3] += 1
+        return {
+            'total_products': self.count,
+            'avg_roi': round(self.roi_tenths / 10 / self.count, 1),
+            'avg_profit': round(self.profit_cents / 100 / self.count, 2),
+            'total_revenue': round(self.revenue_sum, 2),
+            'high_value_count': self.high_value_count,
+            'top_product': self.best_name,
+            'category_breakdown': category_breakdown,
+            'roi_distribution': dict(zip(ROI_DISTRIBUTION_LABELS, self.roi_buckets)),
+            'trend_analysis': {
+                'high_roi_products': self.trends['high_roi_products'],
+                'high_sales_products': self.trends['high_sales_products'],
+                'low_competition_products': self.trends['low_competition_products']
+            },
+            'profit_analysis': {
+                'total_profit_potential': self.raw_profit_sum,
+                'avg_profit_margin': self.margin_sum / self.margin_count if self.margin_count else 0.0,
+                'high_profit_products': self.trends['high_profit_products']
+            },
+            'sales_analysis': {
+                'total_monthly_sales': self.sales_sum,
+                'avg_monthly_sales': avg_sales,
+                'sales_velocity': '高' if avg_sales > 400 else '中' if avg_sales > 200 else '低'
+            }
+        }
+
+class AutomationProductAnalyzer:
+    def __init__(self, products):
+        self.df = pd.DataFrame([p.to_dict() for p in products]) if products else pd.DataFrame()
+        self.app_logger = app.logger
+        self._scores = None
+    
+    @classmethod
+    def from_columns(cls, columns):
+        """直接基于列式产品数据创建分析器，不经过ORM对象和to_dict"""
+        analyzer = cls([])
+        analyzer.df = columns.to_frame()
+        return analyzer
+    
+    @property
+    def scores(self):
+        """整表综合评分（按行顺序与self.df对齐），优先使用已存储的评分列"""
+        if self._scores is None:
+            if 'comprehensive_score' in self.df.columns and self.df['comprehensive_score'].notna().all():
+                self._scores = self.df['comprehensive_score'].astype(float)
             else:
-                roi_counts[4] += 1
+                self._scores = score_products_vectorized(self.df)
+        return self._scores
+    
+    def get_detailed_stats(self):
+        """获取详细统计数据"""
+        return ProductAggregates.from_frame(self.df, scores=self.scores).to_stats()
+
+# ===== 用户统计快照 =====
+class ProductVersionRegistry:
+    """记录每个用户产品表的版本号，产品写入后递增
+    
+    版本号保存在缓存后端的计数器中：使用共享后端时，一个worker的写入会让
+    其他worker的统计快照、列式缓存和聚合在下次读取时失效重建。
+    """
+    def get(self, user_id):
+        return performance_cache.get_counter(f'product_version:{user_id}')
+    
+    def bump(self, user_id):
+        return performance_cache.incr(f'product_version:{user_id}')
+
+product_versions = ProductVersionRegistry()
+
+def _stats_cache_prefix(user_id):
+    return f'stats:{user_id}:'
+
+class ProductColumns:
+    """单个用户产品的列式存储：数值列为NumPy数组，类别和竞争程度为整数编码"""
+    NUMERIC_COLUMNS = ['current_price', 'estimated_cost', 'monthly_sales', 'review_rating'] + DERIVED_METRIC_COLUMNS
+    QUERY_COLUMNS = [Product.id, Product.name, Product.category, Product.competition_level] + \
+        [getattr(Product, column) for column in NUMERIC_COLUMNS]
+    
+    def __init__(self, version=0):
+        self.version = version
+        self.ids = np.empty(0, dtype=np.int64)
+        self.names = np.empty(0, dtype=object)
+        self.numeric = {column: np.empty(0, dtype=float) for column in self.NUMERIC_COLUMNS}
+        self.category_codes = np.empty(0, dtype=np.int32)
+        self.categories = []
+        self.competition_codes = np.empty(0, dtype=np.int32)
+        self.competition_levels = []
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    @property
+    def max_id(self):
+        return int(self.ids[-1]) if len(self.ids) else 0
+    
+    @staticmethod
+    def _encode(values, labels):
+        """把字符串编码为整数，新出现的值追加到labels"""
+        lookup = {label: code for code, label in enumerate(labels)}
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(labels)
+                labels.append(value)
+            codes[i] = code
+        return codes
+    
+    def copy(self, version=None):
+        """浅拷贝：数组只会被整体替换（concatenate生成新数组），标签列表需要复制"""
+        columns = ProductColumns(version=self.version if version is None else version)
+        columns.ids = self.ids
+        columns.names = self.names
+        columns.numeric = dict(self.numeric)
+        columns.category_codes = self.category_codes
+        columns.categories = list(self.categories)
+        columns.competition_codes = self.competition_codes
+        columns.competition_levels = list(self.competition_levels)
+        return columns
+    
+    def load(self, user_id, after_id=0):
+        """按id顺序加载（或追加加载 after_id 之后的）产品，只查询需要的列
         
-        roi_distribution = dict(zip(roi_ranges, roi_counts))
+        会原地修改实例，只能用于尚未发布到ColumnarProductStore的新实例或copy()
+        """
+        rows = db.session.query(*self.QUERY_COLUMNS) \
+            .filter(Product.user_id == user_id, Product.id > after_id) \
+            .order_by(Product.id).all()
+        if not rows:
+            return 0
+        ids, names, categories, competition, *numeric = zip(*rows)
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+        self.names = np.concatenate([self.names, np.asarray(names, dtype=object)])
+        self.category_codes = np.concatenate([self.category_codes, self._encode(categories, self.categories)])
+        self.competition_codes = np.concatenate([self.competition_codes, self._encode(competition, self.competition_levels)])
+        for column, values in zip(self.NUMERIC_COLUMNS, numeric):
+            self.numeric[column] = np.concatenate([self.numeric[column], np.asarray(values, dtype=float)])
+        return len(rows)
+    
+    def to_frame(self, after_id=0):
+        """组装为分析器使用的DataFrame（数组直接作为列，无逐行转换）；after_id 只取id更大的行"""
+        start = int(np.searchsorted(self.ids, after_id, side='right')) if after_id else 0
+        frame = pd.DataFrame({
+            'id': self.ids[start:],
+            'name': self.names[start:],
+            'category': np.asarray(self.categories, dtype=object)[self.category_codes[start:]],
+            'competition_level': np.asarray(self.competition_levels, dtype=object)[self.competition_codes[start:]],
+            **{column: values[start:] for column, values in self.numeric.items()}
+        })
+        frame['review_rating'] = frame['review_rating'].fillna(4.0)
+        return fill_missing_derived_metrics(frame)
+
+class ColumnarProductStore:
+    """每个worker进程内的列式产品缓存，按用户LRU保存，产品变更时追加最新行"""
+    def __init__(self, max_users=256):
+        self._columns = OrderedDict()
+        self._lock = threading.RLock()
+        self.max_users = max_users
+    
+    def get(self, user_id):
+        version = product_versions.get(user_id)
+        with self._lock:
+            columns = self._columns.get(user_id)
+            if columns is not None and columns.version == version:
+                self._columns.move_to_end(user_id)
+                return columns
+        columns = ProductColumns(version=version)
+        columns.load(user_id)
+        self._store(user_id, columns)
+        return columns
+    
+    def _store(self, user_id, columns):
+        with self._lock:
+            self._columns[user_id] = columns
+            self._columns.move_to_end(user_id)
+            while len(self._columns) > self.max_users:
+                self._columns.popitem(last=False)
+    
+    def apply_change(self, user_id, old_version, new_version, cleared=False):
+        """清空时置空；新增时只加载id大于已缓存最大id的行
         
-        # 趋势分析
-        trend_analysis = {
-            'high_roi_products': len(self.df[self.df['estimated_roi'] > 100]),
-            'high_sales_products': len(self.df[self.df['monthly_sales'] > 300]),
-            'low_competition_products': len(self.df[self.df['competition_level'] == '低'])
-        }
+        已发布的实例可能正被读者使用（to_frame不加锁），因此追加写入副本后整体替换
+        """
+        with self._lock:
+            if cleared:
+                columns = ProductColumns(version=new_version)
+                columns.load(user_id)
+                self._store(user_id, columns)
+                return
+            columns = self._columns.get(user_id)
+            if columns is None or columns.version != old_version:
+                self._columns.pop(user_id, None)
+                return
+            updated = columns.copy(version=new_version)
+            updated.load(user_id, after_id=columns.max_id)
+            self._store(user_id, updated)
+
+columnar_store = ColumnarProductStore()
+
+class AggregateStore:
+    """按用户保存ProductAggregates，产品写入时增量更新，版本不一致时重建"""
+    def __init__(self):
+        self._aggregates = {}
+        self._lock = threading.Lock()
+    
+    def _build(self, user_id, version):
+        columns = columnar_store.get(user_id)
+        analyzer = AutomationProductAnalyzer.from_columns(columns)
+        aggregates = ProductAggregates.from_frame(analyzer.df, scores=analyzer.scores, version=version)
+        aggregates.max_id = columns.max_id
+        return aggregates
+    
+    def get(self, user_id):
+        version = product_versions.get(user_id)
+        with self._lock:
+            aggregates = self._aggregates.get(user_id)
+        if aggregates is None or aggregates.version != version:
+            aggregates = self._build(user_id, version)
+            with self._lock:
+                self._aggregates[user_id] = aggregates
+        return aggregates
+    
+    def apply_change(self, user_id, old_version, new_version, cleared=False):
+        """增量应用产品变更：从列式缓存取已累加max_id之后的行；无法增量时丢弃，下次访问重建
         
-        # 利润分析
-        profit_analysis = {
-            'total_profit_potential': float((self.df['current_price'] - self.df['estimated_cost']).sum()),
-            'avg_profit_margin': float(((self.df['current_price'] - self.df['estimated_cost']) / self.df['current_price'] * 100).mean()),
-            'high_profit_products': len(self.df[self.df['estimated_profit'] > 20])
-        }
+        产品提交后、版本号递增前的读取可能已按旧版本号重建聚合并包含新行，
+        因此按id而不是调用方传入的数据判断哪些行尚未累加。
+        to_stats不加锁读取，因此在副本上累加后用一次赋值发布。
+        """
+        with self._lock:
+            aggregates = self._aggregates.get(user_id)
+            if cleared or aggregates is None or aggregates.version != old_version:
+                self._aggregates.pop(user_id, None)
+                return
+            columns = columnar_store.get(user_id)
+            added = columns.to_frame(after_id=aggregates.max_id)
+            updated = aggregates.copy(version=new_version)
+            if not added.empty:
+                updated.add_frame(added, scores=added['comprehensive_score'])
+            updated.max_id = max(aggregates.max_id, columns.max_id)
+            self._aggregates[user_id] = updated
+
+aggregate_store = AggregateStore()
+
+# ===== 数据库端聚合 =====
+# 派生指标均已存为索引列，聚合和排序直接使用列
+product_sql = SimpleNamespace(
+    profit=Product.current_price - Product.estimated_cost,
+    rounded_profit=Product.estimated_profit,
+    roi=Product.estimated_roi,
+    revenue=Product.revenue_potential,
+    margin=case((Product.current_price != 0, (Product.current_price - Product.estimated_cost) / Product.current_price * 100), else_=None),
+    score=Product.comprehensive_score
+)
+
+class SQLStatsBackend:
+    """在数据库中完成聚合（AVG/SUM/GROUP BY/CASE），返回与get_detailed_stats相同结构"""
+    def __init__(self, user_id):
+        self.user_id = user_id
+    
+    @staticmethod
+    def _count_if(condition):
+        return func.sum(case((condition, 1), else_=0))
+    
+    def get_detailed_stats(self):
+        expr = product_sql
+        bucket_conditions = [expr.roi <= edge for edge in ROI_DISTRIBUTION_EDGES]
+        bucket_columns = []
+        lower = None
+        for condition, edge in zip(bucket_conditions, ROI_DISTRIBUTION_EDGES):
+            bucket_columns.append(self._count_if(condition if lower is None else (expr.roi > lower) & condition))
+            lower = edge
+        bucket_columns.append(self._count_if(expr.roi > lower))
         
-        # 销售分析
-        sales_analysis = {
-            'total_monthly_sales': int(self.df['monthly_sales'].sum()),
-            'avg_monthly_sales': float(self.df['monthly_sales'].mean()),
-            'sales_velocity': '高' if self.df['monthly_sales'].mean() > 400 else '中' if self.df['monthly_sales'].mean() > 200 else '低'
-        }
+        totals = db.session.query(
+            func.count(Product.id),
+            func.sum(expr.roi),
+            func.sum(expr.rounded_profit),
+            func.sum(expr.revenue),
+            self._count_if(expr.score >= HIGH_VALUE_SCORE),
+            func.sum(expr.profit),
+            func.avg(expr.margin),
+            func.sum(Product.monthly_sales),
+            self._count_if(expr.roi > 100),
+            self._count_if(Product.monthly_sales > 300),
+            self._count_if(Product.competition_level == '低'),
+            self._count_if(expr.rounded_profit > 20),
+            self._count_if(or_(*[getattr(Product, column).is_(None) for column in DERIVED_METRIC_COLUMNS])),
+            *bucket_columns
+        ).filter(Product.user_id == self.user_id).one()
         
+        count = totals[0] or 0
+        if count == 0:
+            return ProductAggregates().to_stats()
+        if totals[12]:
+            # 存在尚未回填派生指标的行，改用内存聚合（会补算空值）
+            app.logger.warning(f"用户 {self.user_id} 有 {totals[12]} 个产品缺少派生指标，改用内存聚合")
+            return aggregate_store.get(self.user_id).to_stats()
+        (roi_sum, profit_sum, revenue_sum, high_value_count, raw_profit_sum, avg_margin, sales_sum,
+         high_roi, high_sales, low_competition, high_profit) = totals[1:12]
+        buckets = [int(value or 0) for value in totals[13:]]
+        
+        categories = db.session.query(
+            Product.category,
+            func.count(Product.id),
+            func.avg(expr.roi),
+            func.avg(expr.rounded_profit),
+            func.sum(expr.revenue)
+        ).filter(Product.user_id == self.user_id).group_by(Product.category).order_by(func.min(Product.id)).all()
+        
+        top_product = db.session.query(Product.name).filter(Product.user_id == self.user_id) \
+            .order_by(expr.roi.desc(), Product.id).limit(1).scalar()
+        
+        avg_sales = float(sales_sum) / count
         return {
-            'total_products': total_products,
-            'avg_roi': round(avg_roi, 1),
-            'avg_profit': round(avg_profit, 2),
-            'total_revenue': round(total_revenue, 2),
-            'high_value_count': high_value_count,
-            'top_product': best_product,
-            'category_breakdown': category_breakdown,
-            'roi_distribution': roi_distribution,
-            'trend_analysis': trend_analysis,
-            'profit_analysis': profit_analysis,
-            'sales_analysis': sales_analysis
+            'total_products': count,
+            'avg_roi': round(float(roi_sum) / count, 1),
+            'avg_profit': round(float(profit_sum) / count, 2),
+            'total_revenue': round(float(revenue_sum), 2),
+            'high_value_count': int(high_value_count),
+            'top_product': top_product,
+            'category_breakdown': {
+                category: {
+                    'count': category_count,
+                    'avg_roi': float(category_roi),
+                    'avg_profit': float(category_profit),
+                    'total_revenue': float(category_revenue)
+                }
+                for category, category_count, category_roi, category_profit, category_revenue in categories
+            },
+            'roi_distribution': dict(zip(ROI_DISTRIBUTION_LABELS, buckets)),
+            'trend_analysis': {
+                'high_roi_products': int(high_roi),
+                'high_sales_products': int(high_sales),
+                'low_competition_products': int(low_competition)
+            },
+            'profit_analysis': {
+                'total_profit_potential': float(raw_profit_sum),
+                'avg_profit_margin': float(avg_margin or 0.0),
+                'high_profit_products': int(high_profit)
+            },
+            'sales_analysis': {
+                'total_monthly_sales': int(sales_sum),
+                'avg_monthly_sales': avg_sales,
+                'sales_velocity': '高' if avg_sales > 400 else '中' if avg_sales > 200 else '低'
+            }
         }
+# ===== 数据库端聚合结束 =====
+
+def get_user_stats(user_id):
+    """获取用户统计快照，产品版本未变化时直接返回缓存结果"""
+    cache_key = f'{_stats_cache_prefix(user_id)}{product_versions.get(user_id)}'
+    stats = performance_cache.get(cache_key)
+    if stats is None:
+        if app.config['STATS_BACKEND'] == 'sql':
+            stats = SQLStatsBackend(user_id).get_detailed_stats()
+        else:
+            stats = aggregate_store.get(user_id).to_stats()
+        performance_cache.set(cache_key, stats, ttl=app.config['STATS_CACHE_TTL'])
+    return dict(stats)
+
+def on_products_changed(user_id, cleared=False):
+    """产品写入提交后调用：递增版本号、清除旧快照并增量更新列式缓存和聚合
+    
+    cleared 表示该用户产品已全部删除。
+    """
+    old_version = product_versions.get(user_id)
+    new_version = product_versions.bump(user_id)
+    performance_cache.invalidate(_stats_cache_prefix(user_id))
+    columnar_store.apply_change(user_id, old_version, new_version, cleared=cleared)
+    aggregate_store.apply_change(user_id, old_version, new_version, cleared=cleared)
+# ===== 用户统计快照结束 =====
 
 # 邮件服务类（优化版）
 class EmailService:
@@ -566,7 +2030,8 @@ class EmailService:
                     html=html_body
                 )
                 
-                mail.send(msg)
+                with TimeoutMailConnection(app.extensions['mail']) as connection:
+                    connection.send(msg)
                 self.app_logger.info(f"报告邮件发送成功: {user_email}")
                 return True
             
@@ -578,49 +2043,436 @@ class EmailService:
             return False
 
 # 定时任务函数
-def generate_daily_reports():
-    """生成每日报告"""
+def build_aggregates_by_user(df):
+    """对多个用户的产品DataFrame（含user_id列）做一次分组聚合，返回 {user_id: ProductAggregates}"""
+    if df.empty:
+        return {}
+    df = derive_product_metrics(df)
+    if 'comprehensive_score' not in df.columns or df['comprehensive_score'].isna().any():
+        df['comprehensive_score'] = score_products_vectorized(df)
+    
+    price = df['current_price'].astype(float)
+    raw_profit = price - df['estimated_cost'].astype(float)
+    margin = (raw_profit / price.where(price != 0) * 100).replace([np.inf, -np.inf], np.nan)
+    roi = df['estimated_roi'].astype(float)
+    df = df.assign(
+        roi_tenths=np.rint(roi * 10).astype(np.int64),
+        profit_cents=np.rint(df['estimated_profit'].astype(float) * 100).astype(np.int64),
+        raw_profit=raw_profit,
+        margin=margin,
+        is_high_value=df['comprehensive_score'] >= HIGH_VALUE_SCORE,
+        is_high_roi=roi > 100,
+        is_high_sales=df['monthly_sales'] > 300,
+        is_low_competition=df['competition_level'] == '低',
+        is_high_profit=df['estimated_profit'] > 20,
+        roi_bucket=np.digitize(roi, ROI_DISTRIBUTION_EDGES, right=True)
+    )
+    
+    by_user = df.groupby('user_id', sort=False)
+    totals = by_user.agg(
+        count=('name', 'size'),
+        roi_tenths=('roi_tenths', 'sum'),
+        profit_cents=('profit_cents', 'sum'),
+        raw_profit=('raw_profit', 'sum'),
+        revenue=('revenue_potential', 'sum'),
+        sales=('monthly_sales', 'sum'),
+        margin_sum=('margin', 'sum'),
+        margin_count=('margin', 'count'),
+        high_value=('is_high_value', 'sum'),
+        high_roi=('is_high_roi', 'sum'),
+        high_sales=('is_high_sales', 'sum'),
+        low_competition=('is_low_competition', 'sum'),
+        high_profit=('is_high_profit', 'sum')
+    )
+    best_rows = by_user['estimated_roi'].idxmax()
+    categories = df.groupby(['user_id', 'category'], sort=False).agg(
+        count=('name', 'size'),
+        roi_sum=('estimated_roi', 'sum'),
+        profit_sum=('estimated_profit', 'sum'),
+        revenue_sum=('revenue_potential', 'sum')
+    )
+    buckets = df.groupby(['user_id', 'roi_bucket']).size().unstack(fill_value=0) \
+        .reindex(columns=range(len(ROI_DISTRIBUTION_LABELS)), fill_value=0)
+    
+    result = {}
+    for user_id, row in totals.iterrows():
+        aggregates = ProductAggregates()
+        aggregates.count = int(row['count'])
+        aggregates.roi_tenths = int(row['roi_tenths'])
+        aggregates.profit_cents = int(row['profit_cents'])
+        aggregates.raw_profit_sum = float(row['raw_profit'])
+        aggregates.revenue_sum = float(row['revenue'])
+        aggregates.sales_sum = int(row['sales'])
+        aggregates.margin_sum = float(row['margin_sum'])
+        aggregates.margin_count = int(row['margin_count'])
+        aggregates.high_value_count = int(row['high_value'])
+        aggregates.trends = {
+            'high_roi_products': int(row['high_roi']),
+            'high_sales_products': int(row['high_sales']),
+            'low_competition_products': int(row['low_competition']),
+            'high_profit_products': int(row['high_profit'])
+        }
+        aggregates.roi_buckets = [int(count) for count in buckets.loc[user_id]]
+        best_row = df.loc[best_rows[user_id]]
+        aggregates.best_roi = float(best_row['estimated_roi'])
+        aggregates.best_name = best_row['name']
+        result[user_id] = aggregates
+    
+    for (user_id, category), row in categories.iterrows():
+        result[user_id].categories[category] = {
+            'count': int(row['count']),
+            'roi_sum': float(row['roi_sum']),
+            'profit_sum': float(row['profit_sum']),
+            'revenue_sum': float(row['revenue_sum'])
+        }
+    return result
+
+def load_report_products_frame(user_ids=None):
+    """一次查询加载所有接收通知的活跃用户的产品列，可限定为部分用户"""
+    columns = [Product.user_id] + ProductColumns.QUERY_COLUMNS
+    query = db.session.query(*columns) \
+        .join(User, User.id == Product.user_id) \
+        .filter(User.is_active.is_(True), User.receive_notifications.is_(True))
+    if user_ids is not None:
+        query = query.filter(Product.user_id.in_(user_ids))
+    rows = query.order_by(Product.id).all()
+    frame = pd.DataFrame.from_records(rows, columns=[column.key for column in columns])
+    if not frame.empty:
+        frame['review_rating'] = frame['review_rating'].fillna(4.0)
+    return fill_missing_derived_metrics(frame)
+
+def product_fingerprints(user_ids):
+    """按用户计算产品集合指纹（数量:最大ID:最近更新时间），一次分组查询"""
+    if not user_ids:
+        return {}
+    rows = db.session.query(
+        Product.user_id, func.count(Product.id), func.max(Product.id), func.max(Product.updated_at)
+    ).filter(Product.user_id.in_(user_ids)).group_by(Product.user_id).all()
+    return {
+        user_id: f"{count}:{max_id}:{max_updated.isoformat() if isinstance(max_updated, datetime) else max_updated}"
+        for user_id, count, max_id, max_updated in rows
+    }
+
+def _utc_day_start():
+    """当天UTC零点（与数据库中存储的无时区时间比较）"""
+    return datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+def load_today_snapshots(fingerprints):
+    """查找当天已生成且产品指纹未变化的报告，复用其统计数据"""
+    if not fingerprints:
+        return {}
+    rows = db.session.query(Report.user_id, Report.product_fingerprint, Report.payload, Report.report_data) \
+        .filter(Report.user_id.in_(list(fingerprints)),
+                Report.generated_at >= _utc_day_start(),
+                Report.product_fingerprint.isnot(None)) \
+        .order_by(Report.generated_at, Report.id).all()
+    snapshots = {}
+    for user_id, fingerprint, payload, report_data in rows:
+        if fingerprint == fingerprints[user_id]:
+            snapshots[user_id] = (payload, report_data)
+        else:
+            snapshots.pop(user_id, None)
+    
+    stats_by_user = {}
+    for user_id, (payload, report_data) in snapshots.items():
+        stats = decode_report_payload(payload, report_data)
+        stats.pop('weekly_insights', None)
+        stats_by_user[user_id] = stats
+    return stats_by_user
+
+class ReportTrendEngine:
+    """基于已存储的报告历史计算趋势：每个用户只读取最近N份报告（窗口查询走 user_id+generated_at 索引）"""
+    
+    METRIC_KEYS = ['total_products', 'avg_roi', 'high_value_count', 'total_revenue']
+    DEFAULT_RECOMMENDATIONS = ['建议关注高ROI产品', '优化低销量产品策略']
+    TOP_MOVERS = 3
+    
+    def __init__(self, window=None, report_type='daily'):
+        self.window = window or app.config['REPORT_TREND_WINDOW']
+        self.report_type = report_type
+    
+    def load_history(self, user_ids):
+        """ROW_NUMBER 窗口查询取每个用户最近N份报告的摘要列（不读取压缩数据），按时间正序"""
+        if not user_ids:
+            return {}
+        ranked = db.session.query(
+            Report.id.label('id'),
+            func.row_number().over(
+                partition_by=Report.user_id,
+                order_by=(Report.generated_at.desc(), Report.id.desc())
+            ).label('position')
+        ).filter(Report.user_id.in_(list(user_ids)), Report.report_type == self.report_type).subquery()
+        
+        rows = db.session.query(Report.id, Report.user_id, Report.generated_at,
+                                *[getattr(Report, column) for column in REPORT_SUMMARY_COLUMNS]) \
+            .join(ranked, ranked.c.id == Report.id) \
+            .filter(ranked.c.position <= self.window) \
+            .order_by(Report.user_id, Report.generated_at, Report.id).all()
+        
+        history = {}
+        for row in rows:
+            history.setdefault(row.user_id, []).append(row)
+        return history
+    
+    @staticmethod
+    def load_baselines(history):
+        """只为每个用户窗口内最早的一份报告加载并解码完整数据，返回 {user_id: data}"""
+        baseline_ids = [reports[0].id for reports in history.values() if reports]
+        if not baseline_ids:
+            return {}
+        reports = Report.query.options(db.undefer(Report.payload), db.undefer(Report.report_data)) \
+            .filter(Report.id.in_(baseline_ids)).all()
+        return {report.user_id: report.data for report in reports}
+    
+    @staticmethod
+    def _delta(previous, current):
+        change = round(current - previous, 2)
+        return {
+            'previous': previous,
+            'current': current,
+            'change': change,
+            'change_pct': round(change / previous * 100, 1) if previous else None
+        }
+    
+    def compare(self, current, baseline):
+        """对比两份统计：核心指标差值与类别变化（按收益变化排序的前几名）"""
+        deltas = {key: self._delta(baseline.get(key, 0), current.get(key, 0)) for key in self.METRIC_KEYS}
+        
+        previous_categories = baseline.get('category_breakdown', {})
+        current_categories = current.get('category_breakdown', {})
+        category_changes = {}
+        for category in sorted(set(previous_categories) | set(current_categories)):
+            before = previous_categories.get(category, {})
+            after = current_categories.get(category, {})
+            category_changes[category] = {
+                'count_change': after.get('count', 0) - before.get('count', 0),
+                'revenue_change': round(after.get('total_revenue', 0) - before.get('total_revenue', 0), 2)
+            }
+        movers = sorted(
+            ((category, change) for category, change in category_changes.items()
+             if change['count_change'] or change['revenue_change']),
+            key=lambda item: (-abs(item[1]['revenue_change']), -abs(item[1]['count_change']), item[0])
+        )[:self.TOP_MOVERS]
+        top_movers = [dict(category=category, **change) for category, change in movers]
+        return deltas, category_changes, top_movers
+    
+    def summarize(self, deltas, top_movers):
+        """根据差值生成趋势描述与建议"""
+        roi_change = deltas['avg_roi']['change']
+        revenue_change = deltas['total_revenue']['change']
+        if roi_change == 0 and revenue_change == 0:
+            trend = '本周表现稳定'
+        else:
+            parts = []
+            if roi_change:
+                parts.append(f"平均ROI{'上升' if roi_change > 0 else '下降'} {abs(roi_change)}%")
+            if revenue_change:
+                parts.append(f"总收益潜力{'增加' if revenue_change > 0 else '减少'} ${abs(revenue_change):.2f}")
+            trend = '较上周' + '，'.join(parts)
+        
+        recommendations = []
+        if roi_change < 0:
+            recommendations.append('平均ROI下降，建议复查低ROI产品的定价与成本')
+        if deltas['high_value_count']['change'] < 0:
+            recommendations.append('高价值产品减少，建议补充高评分选品')
+        if deltas['total_products']['change'] > 0:
+            recommendations.append(f"本周新增 {int(deltas['total_products']['change'])} 个产品，建议跟踪其销量表现")
+        for mover in top_movers:
+            if mover['revenue_change'] < 0:
+                recommendations.append(f"{mover['category']}类收益潜力下降最多，建议重点关注")
+                break
+        return trend, recommendations or list(self.DEFAULT_RECOMMENDATIONS)
+    
+    def build_insights(self, stats_by_user):
+        """为每个用户生成周报洞察：以窗口内最早的报告为基准，对比本次统计（只解码基准报告）"""
+        history = self.load_history(stats_by_user)
+        baselines = self.load_baselines(history)
+        insights = {}
+        for user_id, stats in stats_by_user.items():
+            reports = history.get(user_id)
+            if not reports:
+                insights[user_id] = {'weekly_insights': {
+                    'reports_compared': 0,
+                    'trend_comparison': '暂无历史报告，无法对比趋势',
+                    'recommendations': list(self.DEFAULT_RECOMMENDATIONS)
+                }}
+                continue
+            
+            baseline_report = reports[0]
+            baseline_at = baseline_report.generated_at
+            deltas, category_changes, top_movers = self.compare(stats, baselines[user_id])
+            trend, recommendations = self.summarize(deltas, top_movers)
+            insights[user_id] = {'weekly_insights': {
+                'reports_compared': len(reports),
+                'baseline_date': baseline_at.strftime('%Y-%m-%d') if isinstance(baseline_at, datetime) else str(baseline_at)[:10],
+                'deltas': deltas,
+                'category_changes': category_changes,
+                'top_movers': top_movers,
+                'roi_series': [report.avg_roi or 0 for report in reports],
+                'trend_comparison': trend,
+                'recommendations': recommendations
+            }}
+        return insights
+
+def build_weekly_insights(stats_by_user):
+    """周报洞察：对比近N份日报，不重新扫描产品"""
+    return ReportTrendEngine().build_insights(stats_by_user)
+
+# 最近一次报告任务的运行摘要（按报告类型），供系统状态接口查看
+report_run_summaries = {}
+
+class ReportDeliveryTracker:
+    """记录一批报告邮件的发送状态：超时判定与发送成功后的写库互斥，
+    已判定超时的报告不会再被标记为已发送"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = {}
+        self._finishing = set()
+        self.timed_out = set()
+    
+    def start(self, report_id):
+        with self._lock:
+            self._started[report_id] = time.time()
+    
+    def finish(self, report_id):
+        """发送完成后调用，返回False表示该报告已判定超时，不应再写库"""
+        with self._lock:
+            if report_id in self.timed_out:
+                return False
+            self._finishing.add(report_id)
+            return True
+    
+    def expire(self, report_id, timeout, now):
+        """已开始且超过时限、尚未进入写库阶段的报告判定为超时"""
+        with self._lock:
+            started = self._started.get(report_id)
+            if started is None or report_id in self._finishing or now - started <= timeout:
+                return False
+            self.timed_out.add(report_id)
+            return True
+
+def deliver_user_report(report_id, email, username, report_data, tracker):
+    """在报告线程池中发送单个用户的报告邮件，使用独立的应用上下文与数据库会话"""
+    tracker.start(report_id)
     with app.app_context():
         try:
-            app.logger.info("开始生成每日报告...")
-            print("🔄 生成每日报告中...")
-            
-            users = User.query.filter_by(is_active=True, receive_notifications=True).all()
-            email_service = EmailService()
-            
-            for user in users:
-                user_products = Product.query.filter_by(user_id=user.id).all()
-                
-                if not user_products:
-                    continue
-                
-                analyzer = AutomationProductAnalyzer(user_products)
-                report_data = analyzer.get_detailed_stats()
-                
-                # 保存报告到数据库
-                report = Report(
-                    user_id=user.id,
-                    report_type='daily',
-                    report_data=json.dumps(report_data, ensure_ascii=False)
+            email_sent = EmailService().send_report_email(email, username, report_data, "")
+            if email_sent and not tracker.finish(report_id):
+                app.logger.warning(f"报告 {report_id} 已判定超时，忽略迟到的发送结果")
+                return False
+            if email_sent:
+                Report.query.filter_by(id=report_id).update(
+                    {'sent_via_email': True, 'email_sent_at': datetime.now(timezone.utc)},
+                    synchronize_session=False
                 )
-                db.session.add(report)
                 db.session.commit()
-                
-                # 发送邮件
-                if email_service.send_report_email(user.email, user.username, report_data, ""):
-                    report.sent_via_email = True
-                    report.email_sent_at = datetime.now(timezone.utc)
-                    db.session.commit()
-                
-                app.logger.info(f"用户 {user.username} 的每日报告生成完成")
-                print(f"✅ {user.username} 的每日报告生成完成")
+            return bool(email_sent)
+        except Exception:
+            db.session.rollback()
+            raise
+
+def run_report_batch(report_type, insights_builder=None):
+    """批量生成报告：复用当天未变化的统计快照，其余用户一次加载产品、一次分组统计，
+    一个事务写入全部报告，再把邮件发送分发到报告线程池"""
+    start_time = time.time()
+    users = User.query.filter_by(is_active=True, receive_notifications=True).all()
+    fingerprints = product_fingerprints([user.id for user in users])
+    
+    stats_by_user = load_today_snapshots(fingerprints)
+    reused = len(stats_by_user)
+    stale_user_ids = [user_id for user_id in fingerprints if user_id not in stats_by_user]
+    if stale_user_ids:
+        aggregates_by_user = build_aggregates_by_user(load_report_products_frame(stale_user_ids))
+        for user_id, aggregates in aggregates_by_user.items():
+            stats_by_user[user_id] = aggregates.to_stats()
+    extras = insights_builder(stats_by_user) if insights_builder else {}
+    
+    pending = []
+    for user in users:
+        stats = stats_by_user.get(user.id)
+        if stats is None:
+            continue
+        report_data = dict(stats)
+        report_data.update(extras.get(user.id, {}))
+        report = Report(
+            user_id=user.id,
+            report_type=report_type,
+            product_fingerprint=fingerprints[user.id]
+        )
+        report.set_data(report_data)
+        db.session.add(report)
+        pending.append((user, report, report_data))
+    
+    db.session.flush()
+    deliveries = [(user.id, user.email, user.username, report.id, report_data) for user, report, report_data in pending]
+    db.session.commit()
+    
+    # 每个用户的邮件发送互不影响：单个失败或超时只记入摘要
+    timeout = app.config['REPORT_USER_TIMEOUT']
+    tracker = ReportDeliveryTracker()
+    futures = {
+        report_executor.submit(deliver_user_report, report_id, email, username, report_data, tracker): (user_id, report_id)
+        for user_id, email, username, report_id, report_data in deliveries
+    }
+    summary = {
+        'report_type': report_type,
+        'users': len(users),
+        'reports': len(deliveries),
+        'reused_snapshots': reused,
+        'emails_sent': 0,
+        'failed': [],
+        'timed_out': []
+    }
+    waiting = set(futures)
+    while waiting:
+        done, waiting = wait(waiting, timeout=1, return_when=FIRST_COMPLETED)
+        for future in done:
+            user_id, report_id = futures[future]
+            try:
+                if future.result():
+                    summary['emails_sent'] += 1
+                else:
+                    summary['failed'].append({'user_id': user_id, 'error': '邮件发送失败'})
+            except Exception as e:
+                app.logger.error(f"用户 {user_id} 报告发送失败: {e}")
+                summary['failed'].append({'user_id': user_id, 'error': str(e)})
+        
+        # 已开始执行且超过单用户时限的任务不再等待；线程无法强制中止，
+        # 由MAIL_TIMEOUT保证SMTP调用最终返回，迟到的结果不会写库
+        now = time.time()
+        for future in list(waiting):
+            user_id, report_id = futures[future]
+            if tracker.expire(report_id, timeout, now):
+                waiting.discard(future)
+                app.logger.warning(f"用户 {user_id} 报告发送超时（>{timeout}秒）")
+                summary['timed_out'].append(user_id)
+    
+    elapsed = time.time() - start_time
+    summary['elapsed_seconds'] = round(elapsed, 3)
+    summary['users_per_second'] = round(len(deliveries) / elapsed, 1) if elapsed > 0 else None
+    summary['finished_at'] = datetime.now(timezone.utc).isoformat()
+    report_run_summaries[report_type] = summary
+    return summary
+
+def generate_daily_reports():
+    """生成每日报告"""
+    with app.app_context():
+        try:
+            app.logger.info("开始生成每日报告...")
+            print("🔄 生成每日报告中...")
+            
+            result = run_report_batch('daily')
             
-            app.logger.info("所有用户每日报告生成完成")
-            print("✅ 所有用户每日报告生成完成")
+            app.logger.info(f"所有用户每日报告生成完成: {result}")
+            print(f"✅ 所有用户每日报告生成完成: {result['reports']} 份报告, {result['emails_sent']} 封邮件, "
+                  f"失败 {len(result['failed'])}, 超时 {len(result['timed_out'])}, 耗时 {result['elapsed_seconds']}秒")
+            return result['reports']
             
         except Exception as e:
+            db.session.rollback()
             app.logger.error(f"生成每日报告失败: {e}")
             print(f"❌ 生成每日报告失败: {e}")
+            raise
 
 def generate_weekly_summary():
     """生成每周总结"""
@@ -629,62 +2481,340 @@ def generate_weekly_summary():
             app.logger.info("开始生成每周总结...")
             print("🔄 生成每周总结中...")
             
-            users = User.query.filter_by(is_active=True, receive_notifications=True).all()
-            email_service = EmailService()
-            
-            for user in users:
-                user_products = Product.query.filter_by(user_id=user.id).all()
-                
-                if not user_products:
-                    continue
-                
-                analyzer = AutomationProductAnalyzer(user_products)
-                report_data = analyzer.get_detailed_stats()
-                
-                # 添加周报特定分析
-                report_data['weekly_insights'] = {
-                    'trend_comparison': '本周表现稳定',
-                    'recommendations': ['建议关注高ROI产品', '优化低销量产品策略']
-                }
-                
-                # 保存报告到数据库
-                report = Report(
-                    user_id=user.id,
-                    report_type='weekly',
-                    report_data=json.dumps(report_data, ensure_ascii=False)
-                )
-                db.session.add(report)
-                db.session.commit()
-                
-                # 发送邮件
-                if email_service.send_report_email(user.email, user.username, report_data, ""):
-                    report.sent_via_email = True
-                    report.email_sent_at = datetime.now(timezone.utc)
-                    db.session.commit()
-                
-                app.logger.info(f"用户 {user.username} 的周报生成完成")
-                print(f"✅ {user.username} 的周报生成完成")
+            # 周报统计复用当天日报快照，周报洞察来自近7天已存储的日报
+            result = run_report_batch('weekly', insights_builder=build_weekly_insights)
             
-            app.logger.info("所有用户周报生成完成")
-            print("✅ 所有用户周报生成完成")
+            app.logger.info(f"所有用户周报生成完成: {result}")
+            print(f"✅ 所有用户周报生成完成: {result['reports']} 份报告, {result['emails_sent']} 封邮件, "
+                  f"失败 {len(result['failed'])}, 超时 {len(result['timed_out'])}, 耗时 {result['elapsed_seconds']}秒")
+            return result['reports']
             
         except Exception as e:
+            db.session.rollback()
             app.logger.error(f"生成周报失败: {e}")
             print(f"❌ 生成周报失败: {e}")
+            raise
+
+# ===== 报告保留与汇总 =====
+
+# (来源报告类型, 汇总报告类型, 保留天数配置项, 周期粒度)，按顺序执行
+REPORT_ROLLUP_STAGES = [
+    (['daily', 'manual'], 'weekly_rollup', 'REPORT_RETENTION_DAILY_DAYS', 'week'),
+    (['weekly', 'weekly_rollup'], 'monthly_rollup', 'REPORT_RETENTION_WEEKLY_DAYS', 'month'),
+]
+
+# 最近一次保留任务的统计，供系统状态接口查看
+report_retention_stats = {}
+
+def _report_period(moment, granularity):
+    if granularity == 'week':
+        year, week, weekday = moment.isocalendar()
+        period = f"{year}-W{week:02d}"
+        monday = moment - timedelta(days=weekday - 1)
+        if monday.month != (monday + timedelta(days=6)).month:
+            # 跨月的周按月拆成两份周汇总，月汇总时各自计入所在月份
+            period += f"-{moment.month:02d}"
+        return period
+    return moment.strftime('%Y-%m')
+
+def _report_partial(report):
+    """把一份报告转为可合并的部分汇总：原始报告读摘要列，汇总报告读其payload"""
+    if report.report_type.endswith('_rollup'):
+        data = report.data
+        return {
+            'reports': data['reports'],
+            'sums': dict(data['sums']),
+            'roi_min': data['roi_min'],
+            'roi_max': data['roi_max'],
+            'period_start': datetime.fromisoformat(data['period_start']),
+            'period_end': datetime.fromisoformat(data['period_end']),
+            'last': {column: getattr(report, column) for column in REPORT_SUMMARY_COLUMNS}
+        }
+    
+    values = {column: getattr(report, column) or 0 for column in REPORT_SUMMARY_COLUMNS}
+    return {
+        'reports': 1,
+        'sums': dict(values),
+        'roi_min': values['avg_roi'],
+        'roi_max': values['avg_roi'],
+        'period_start': report.generated_at,
+        'period_end': report.generated_at,
+        'last': values
+    }
+
+def _merge_report_partial(total, partial):
+    if total is None:
+        return partial
+    total['reports'] += partial['reports']
+    for column in REPORT_SUMMARY_COLUMNS:
+        total['sums'][column] += partial['sums'][column]
+    total['roi_min'] = min(total['roi_min'], partial['roi_min'])
+    total['roi_max'] = max(total['roi_max'], partial['roi_max'])
+    total['period_start'] = min(total['period_start'], partial['period_start'])
+    if partial['period_end'] >= total['period_end']:
+        total['period_end'] = partial['period_end']
+        total['last'] = partial['last']
+    return total
+
+def _rollup_report(user_id, report_type, period, total):
+    """生成汇总报告：摘要列取周期内最后一份报告的值，payload保存可继续合并的合计"""
+    count = total['reports']
+    report = Report(
+        user_id=user_id,
+        report_type=report_type,
+        period=period,
+        generated_at=total['period_end'],
+        sent_via_email=False
+    )
+    report.set_data({
+        **total['last'],
+        'period': period,
+        'period_start': total['period_start'].isoformat(),
+        'period_end': total['period_end'].isoformat(),
+        'reports': count,
+        'sums': total['sums'],
+        'roi_min': total['roi_min'],
+        'roi_max': total['roi_max'],
+        'averages': {column: round(total['sums'][column] / count, 2) for column in REPORT_SUMMARY_COLUMNS}
+    })
+    return report
+
+def _compact_user_batch(user_ids, source_types, rollup_type, cutoff, granularity):
+    """在一个事务内汇总一批用户的过期报告并删除原始行，返回 (删除行数, 写入汇总数)"""
+    sources = Report.query.filter(
+        Report.user_id.in_(user_ids),
+        Report.report_type.in_(source_types),
+        Report.generated_at < cutoff
+    ).all()
+    if not sources:
+        return 0, 0
+    
+    # 按周期起点分组：汇总报告的 generated_at 是周期终点
+    totals = {}
+    for report in sources:
+        partial = _report_partial(report)
+        key = (report.user_id, _report_period(partial['period_start'], granularity))
+        totals[key] = _merge_report_partial(totals.get(key), partial)
+    
+    # 同一周期已有的汇总（上次运行时写入）一并合并后替换
+    existing = Report.query.filter(
+        Report.user_id.in_(user_ids),
+        Report.report_type == rollup_type,
+        Report.period.in_({period for _, period in totals})
+    ).all()
+    for report in existing:
+        key = (report.user_id, report.period)
+        if key in totals:
+            totals[key] = _merge_report_partial(totals[key], _report_partial(report))
+            sources.append(report)
+    
+    db.session.add_all([
+        _rollup_report(user_id, rollup_type, period, total)
+        for (user_id, period), total in totals.items()
+    ])
+    deleted = Report.query.filter(Report.id.in_([report.id for report in sources])) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return deleted, len(totals)
+
+def compact_reports(now=None):
+    """按保留策略把过期报告汇总为周/月汇总并分批删除原始行，SQLite下随后执行VACUUM"""
+    start_time = time.time()
+    day_start = (now or datetime.now(timezone.utc)).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    batch_size = app.config['REPORT_RETENTION_BATCH_SIZE']
+    stats = {'stages': {}, 'rows_deleted': 0, 'rollups_written': 0, 'vacuumed': False}
+    
+    for source_types, rollup_type, retention_key, granularity in REPORT_ROLLUP_STAGES:
+        cutoff = day_start - timedelta(days=app.config[retention_key])
+        user_ids = [row[0] for row in db.session.query(Report.user_id).filter(
+            Report.report_type.in_(source_types),
+            Report.generated_at < cutoff
+        ).distinct().order_by(Report.user_id).all()]
+        
+        stage = {'cutoff': cutoff.isoformat(), 'users': len(user_ids), 'rows_deleted': 0, 'rollups_written': 0}
+        for offset in range(0, len(user_ids), batch_size):
+            try:
+                deleted, written = _compact_user_batch(
+                    user_ids[offset:offset + batch_size], source_types, rollup_type, cutoff, granularity
+                )
+            except Exception:
+                db.session.rollback()
+                raise
+            stage['rows_deleted'] += deleted
+            stage['rollups_written'] += written
+        
+        stats['stages'][rollup_type] = stage
+        stats['rows_deleted'] += stage['rows_deleted']
+        stats['rollups_written'] += stage['rollups_written']
+    
+    if stats['rows_deleted'] and app.config['REPORT_RETENTION_VACUUM'] and db.engine.dialect.name == 'sqlite':
+        with db.engine.connect() as connection:
+            connection.execution_options(isolation_level='AUTOCOMMIT').exec_driver_sql('VACUUM')
+        stats['vacuumed'] = True
+    
+    stats['elapsed_seconds'] = round(time.time() - start_time, 3)
+    stats['finished_at'] = datetime.now(timezone.utc).isoformat()
+    report_retention_stats.clear()
+    report_retention_stats.update(stats)
+    return stats
+
+def report_retention_task():
+    """报告保留与汇总任务"""
+    with app.app_context():
+        try:
+            app.logger.info("开始执行报告保留与汇总...")
+            print("🔄 报告保留与汇总中...")
+            
+            stats = compact_reports()
+            
+            app.logger.info(f"报告保留与汇总完成: {stats}")
+            print(f"✅ 报告保留与汇总完成: 删除 {stats['rows_deleted']} 行, 写入 {stats['rollups_written']} 份汇总")
+            return stats['rows_deleted']
+            
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"报告保留与汇总失败: {e}")
+            print(f"❌ 报告保留与汇总失败: {e}")
+            raise
+
+@app.cli.command('compact-reports')
+def compact_reports_command():
+    """按保留策略汇总并清理过期报告"""
+    stats = compact_reports()
+    click.echo(f"✅ 删除 {stats['rows_deleted']} 行报告, 写入 {stats['rollups_written']} 份汇总")
 
 def health_check_task():
     """健康检查任务"""
     app.logger.info("定时任务测试 - 系统运行正常")
     print("💓 系统健康检查 - 运行正常")
 
+# ===== 定时任务主节点选举 =====
+
+class SchedulerLeader:
+    """基于数据库租约行的主节点选举：持有者定期续约，过期后任一进程可用条件更新抢占"""
+    
+    def __init__(self, name='scheduler'):
+        self.name = name
+        self.identity = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.leader = False
+        self.thread = None
+        self.stopping = threading.Event()
+    
+    def try_acquire(self):
+        """获取或续约租约，返回本进程是否为主节点"""
+        now = datetime.now(timezone.utc)
+        ttl = timedelta(seconds=app.config['SCHEDULER_LEASE_TTL'])
+        with app.app_context():
+            try:
+                if db.session.get(SchedulerLease, self.name) is None:
+                    try:
+                        db.session.add(SchedulerLease(name=self.name))
+                        db.session.commit()
+                    except IntegrityError:
+                        db.session.rollback()
+                
+                # 只有当前持有者或租约已过期时才能更新成功
+                acquired = SchedulerLease.query.filter(
+                    SchedulerLease.name == self.name,
+                    or_(SchedulerLease.holder == self.identity,
+                        SchedulerLease.holder.is_(None),
+                        SchedulerLease.expires_at < now)
+                ).update({
+                    'holder': self.identity,
+                    'acquired_at': case(
+                        (SchedulerLease.holder == self.identity, SchedulerLease.acquired_at),
+                        else_=now
+                    ),
+                    'expires_at': now + ttl
+                }, synchronize_session=False)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"定时任务租约续约失败: {e}")
+                acquired = 0
+        
+        is_leader = bool(acquired)
+        if is_leader != self.leader:
+            app.logger.info(f"定时任务主节点{'切换为' if is_leader else '不再是'}本进程: {self.identity}")
+            print(f"{'👑 本进程成为定时任务主节点' if is_leader else '⚠️ 本进程失去定时任务主节点'}: {self.identity}")
+        self.leader = is_leader
+        return is_leader
+    
+    def _heartbeat_loop(self):
+        interval = max(1, app.config['SCHEDULER_LEASE_TTL'] / 3)
+        while not self.stopping.is_set():
+            self.try_acquire()
+            self.stopping.wait(interval)
+    
+    def start(self):
+        """启动续约线程"""
+        if self.thread:
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._heartbeat_loop, name='scheduler-lease', daemon=True)
+        self.thread.start()
+    
+    def release(self):
+        """退出时主动释放租约，便于其他进程立即接管"""
+        self.stopping.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+        if not self.leader:
+            return
+        with app.app_context():
+            SchedulerLease.query.filter_by(name=self.name, holder=self.identity).update(
+                {'holder': None, 'expires_at': None}, synchronize_session=False
+            )
+            db.session.commit()
+        self.leader = False
+    
+    def status(self):
+        lease = db.session.get(SchedulerLease, self.name)
+        return {
+            'leader': lease.holder if lease else None,
+            'lease_expires_at': lease.expires_at.strftime('%Y-%m-%d %H:%M:%S') if lease and lease.expires_at else None,
+            'acquired_at': lease.acquired_at.strftime('%Y-%m-%d %H:%M:%S') if lease and lease.acquired_at else None,
+            'this_process': self.identity,
+            'is_leader': self.leader
+        }
+
+scheduler_leader = SchedulerLeader()
+
+def leader_only(func):
+    """定时任务包装：只在主节点上执行（执行前再确认一次租约）"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not scheduler_leader.try_acquire():
+            app.logger.info(f"跳过定时任务 {func.__name__}：本进程不是主节点")
+            return None
+        return func(*args, **kwargs)
+    return wrapper
+
 # 注册定时任务
+def _record_apscheduler_skip(event):
+    """APScheduler 错过或因实例上限跳过的运行计入任务指标"""
+    reason = '错过计划时间' if event.code == EVENT_JOB_MISSED else '已达最大实例数'
+    job_metrics.record(event.job_id, 'skipped', error=reason)
+
 def register_scheduled_tasks():
     """注册定时任务"""
     try:
+        # 每个进程都注册定时任务，但只有持有租约的主节点真正执行
+        scheduler_leader.start()
+        
+        # 任务函数统一包装执行指标（只在主节点实际执行时记录）
+        daily_reports = leader_only(job_metrics.track('daily_reports', generate_daily_reports))
+        weekly_summary = leader_only(job_metrics.track('weekly_summary', generate_weekly_summary))
+        report_retention = leader_only(job_metrics.track('report_retention', report_retention_task))
+        health_check = job_metrics.track('health_check', health_check_task)
+        
         if APSCHEDULER_AVAILABLE:
             # 使用APScheduler
+            scheduler.add_listener(_record_apscheduler_skip, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+            
             scheduler.add_job(
-                func=generate_daily_reports,
+                func=daily_reports,
                 trigger=CronTrigger(hour=9, minute=0),
                 id='daily_reports',
                 name='生成每日选品分析报告',
@@ -692,7 +2822,7 @@ def register_scheduled_tasks():
             )
             
             scheduler.add_job(
-                func=generate_weekly_summary,
+                func=weekly_summary,
                 trigger=CronTrigger(day_of_week=0, hour=10, minute=0),
                 id='weekly_summary',
                 name='生成每周选品总结',
@@ -700,7 +2830,15 @@ def register_scheduled_tasks():
             )
             
             scheduler.add_job(
-                func=health_check_task,
+                func=report_retention,
+                trigger=CronTrigger(hour=3, minute=30),
+                id='report_retention',
+                name='报告保留与汇总',
+                replace_existing=True
+            )
+            
+            scheduler.add_job(
+                func=health_check,
                 trigger='interval',
                 minutes=5,
                 id='health_check',
@@ -711,24 +2849,39 @@ def register_scheduled_tasks():
         else:
             # 使用优化版定时器
             scheduler.add_job(
-                func=generate_daily_reports,
+                func=daily_reports,
                 trigger_type='cron',
                 hour=9,
-                minute=0
+                minute=0,
+                id='daily_reports',
+                name='生成每日选品分析报告'
             )
             
             scheduler.add_job(
-                func=generate_weekly_summary,
+                func=weekly_summary,
                 trigger_type='cron',
                 hour=10,
                 minute=0,
-                day_of_week=0
+                day_of_week=0,
+                id='weekly_summary',
+                name='生成每周选品总结'
+            )
+            
+            scheduler.add_job(
+                func=report_retention,
+                trigger_type='cron',
+                hour=3,
+                minute=30,
+                id='report_retention',
+                name='报告保留与汇总'
             )
             
             scheduler.add_job(
-                func=health_check_task,
+                func=health_check,
                 trigger_type='interval',
-                minutes=5
+                minutes=5,
+                id='health_check',
+                name='系统健康检查'
             )
             
             scheduler.start()
@@ -742,58 +2895,412 @@ def register_scheduled_tasks():
 
 # 后台任务函数
 def background_generate_report(user_id, report_type):
-    """后台生成报告"""
+    """后台生成报告（由持久化任务队列调用，失败时抛出异常以便重试）"""
     with app.app_context():
         try:
             # 修复：使用新的Session.get()方法替代旧的Query.get()
             user = db.session.get(User, user_id)
             if not user:
-                return
+                return None
             
             app.logger.info(f"后台生成 {report_type} 报告 for {user.username}")
             print(f"🔄 后台生成 {report_type} 报告 for {user.username}")
             
-            user_products = Product.query.filter_by(user_id=user.id).all()
-            if user_products:
-                analyzer = AutomationProductAnalyzer(user_products)
-                report_data = analyzer.get_detailed_stats()
-                
-                report = Report(
-                    user_id=user.id,
-                    report_type=report_type,
-                    report_data=json.dumps(report_data, ensure_ascii=False)
-                )
-                db.session.add(report)
-                db.session.commit()
-                
-                # 如果是手动生成的报告，也尝试发送邮件
-                if report_type == 'manual':
-                    email_service = EmailService()
-                    if email_service.send_report_email(user.email, user.username, report_data, ""):
-                        report.sent_via_email = True
-                        report.email_sent_at = datetime.now(timezone.utc)
-                        db.session.commit()
-                
-                app.logger.info(f"后台报告生成完成: {user.username}")
-                print(f"✅ 后台报告生成完成: {user.username}")
+            columns = columnar_store.get(user.id)
+            if not len(columns):
+                return {'report_id': None, 'message': '暂无产品数据'}
+            
+            analyzer = AutomationProductAnalyzer.from_columns(columns)
+            report_data = analyzer.get_detailed_stats()
+            
+            report = Report(user_id=user.id, report_type=report_type)
+            report.set_data(report_data)
+            db.session.add(report)
+            db.session.commit()
+            
+            # 如果是手动生成的报告，也尝试发送邮件
+            email_sent = False
+            if report_type == 'manual':
+                email_service = EmailService()
+                if email_service.send_report_email(user.email, user.username, report_data, ""):
+                    report.sent_via_email = True
+                    report.email_sent_at = datetime.now(timezone.utc)
+                    db.session.commit()
+                    email_sent = True
+            
+            app.logger.info(f"后台报告生成完成: {user.username}")
+            print(f"✅ 后台报告生成完成: {user.username}")
+            return {'report_id': report.id, 'email_sent': email_sent}
             
         except Exception as e:
+            db.session.rollback()
             app.logger.error(f"后台生成报告失败: {e}")
             print(f"❌ 后台生成报告失败: {e}")
+            raise
+
+# ===== 持久化后台任务队列 =====
+
+# 任务类型 -> 处理函数（参数来自任务payload）
+JOB_HANDLERS = {
+    'generate_report': background_generate_report,
+}
+
+class JobQueueFull(Exception):
+    """排队任务数达到上限"""
+
+class DurableJobQueue:
+    """基于数据库的任务队列：任务行持久化，工作线程用条件更新原子领取，首次入队时才启动工作线程"""
+    
+    def __init__(self):
+        self.worker_id = f"{os.getpid()}-{secrets.token_hex(4)}"
+        self.resume_checked = False
+        self.threads = []
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+    
+    def enqueue(self, job_type, payload, user_id=None, dedup_key=None):
+        """入队；已有相同 dedup_key 的排队任务时直接合并，返回 (任务, 是否合并)"""
+        if dedup_key:
+            existing = BackgroundJob.query.filter_by(dedup_key=dedup_key, status='pending').first()
+            if existing:
+                return self._coalesce(existing), True
+        
+        if BackgroundJob.query.filter_by(status='pending').count() >= app.config['JOB_MAX_PENDING']:
+            raise JobQueueFull('后台任务排队已满，请稍后再试')
+        
+        job = BackgroundJob(
+            job_type=job_type,
+            user_id=user_id,
+            dedup_key=dedup_key,
+            payload=json.dumps(payload, ensure_ascii=False),
+            max_attempts=app.config['JOB_MAX_ATTEMPTS']
+        )
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # 其他worker刚刚插入了相同的排队任务
+            db.session.rollback()
+            existing = BackgroundJob.query.filter_by(dedup_key=dedup_key, status='pending').first()
+            if existing is None:
+                raise
+            return self._coalesce(existing), True
+        
+        self.ensure_started()
+        self.wakeup.set()
+        return job, False
+    
+    def _coalesce(self, job):
+        BackgroundJob.query.filter_by(id=job.id).update(
+            {'coalesced_count': BackgroundJob.coalesced_count + 1}, synchronize_session=False
+        )
+        db.session.commit()
+        db.session.refresh(job)
+        return job
+    
+    def ensure_started(self):
+        """按需启动工作线程（每个进程一次）"""
+        with self.lock:
+            if self.threads:
+                return
+            self.stopping.clear()
+            for index in range(app.config['JOB_WORKERS']):
+                thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{index + 1}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+    
+    def resume_if_needed(self):
+        """进程处理第一个请求时检查是否有遗留任务（如重启前未执行完），有则启动工作线程"""
+        if self.resume_checked:
+            return
+        self.resume_checked = True
+        leftover = db.session.query(BackgroundJob.id).filter(
+            BackgroundJob.status.in_(['pending', 'running'])
+        ).first()
+        if leftover:
+            self.ensure_started()
+    
+    def recover_stale(self):
+        """运行超时的任务（所属worker已退出）重新排队或标记失败"""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=app.config['JOB_LEASE_SECONDS'])
+        stale = BackgroundJob.query.filter(
+            BackgroundJob.status == 'running', BackgroundJob.started_at < cutoff
+        ).all()
+        for job in stale:
+            self._finish_failed(job, '任务运行超时，worker可能已退出')
+        return len(stale)
+    
+    def claim(self):
+        """原子领取一个到期的排队任务：按id取候选，再用带状态条件的UPDATE抢占"""
+        now = datetime.now(timezone.utc)
+        for _ in range(5):
+            candidate = db.session.query(BackgroundJob.id).filter(
+                BackgroundJob.status == 'pending', BackgroundJob.available_at <= now
+            ).order_by(BackgroundJob.id).first()
+            if candidate is None:
+                return None
+            
+            claimed = BackgroundJob.query.filter_by(id=candidate.id, status='pending').update({
+                'status': 'running',
+                'locked_by': self.worker_id,
+                'started_at': now,
+                'finished_at': None,
+                'attempts': BackgroundJob.attempts + 1
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return db.session.get(BackgroundJob, candidate.id)
+        return None
+    
+    def _finish_failed(self, job, error):
+        """失败处理：未超过最大次数时按指数退避重新排队"""
+        failed_fields = {'status': 'failed', 'last_error': error, 'locked_by': None,
+                         'finished_at': datetime.now(timezone.utc)}
+        if job.attempts < job.max_attempts:
+            retry_fields = {'status': 'pending', 'last_error': error, 'locked_by': None,
+                            'available_at': datetime.now(timezone.utc) + timedelta(seconds=10 * 2 ** job.attempts)}
+            try:
+                BackgroundJob.query.filter_by(id=job.id, status='running').update(retry_fields, synchronize_session=False)
+                db.session.commit()
+                return
+            except IntegrityError:
+                # 已有相同的新排队任务，由它代替本任务重试
+                db.session.rollback()
+                failed_fields['last_error'] = f"{error}（已由新的排队任务代替重试）"
+        BackgroundJob.query.filter_by(id=job.id, status='running').update(failed_fields, synchronize_session=False)
+        db.session.commit()
+    
+    def run_job(self, job):
+        handler = JOB_HANDLERS.get(job.job_type)
+        try:
+            if handler is None:
+                raise ValueError(f"未知任务类型: {job.job_type}")
+            result = handler(**json.loads(job.payload or '{}'))
+            BackgroundJob.query.filter_by(id=job.id).update({
+                'status': 'completed',
+                'result': json.dumps(result, ensure_ascii=False) if result is not None else None,
+                'finished_at': datetime.now(timezone.utc),
+                'last_error': None,
+                'locked_by': None
+            }, synchronize_session=False)
+            db.session.commit()
+            self.processed += 1
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"后台任务 {job.id} ({job.job_type}) 执行失败: {e}")
+            self._finish_failed(job, str(e))
+            self.failed += 1
+    
+    def run_pending(self):
+        """领取并执行到期任务直到队列为空，返回执行的任务数"""
+        count = 0
+        while not self.stopping.is_set():
+            with app.app_context():
+                job = self.claim()
+                if job is None:
+                    return count
+                self.run_job(job)
+            count += 1
+        return count
+    
+    def _worker_loop(self):
+        last_recovery = 0
+        while not self.stopping.is_set():
+            try:
+                if time.time() - last_recovery > 60:
+                    with app.app_context():
+                        self.recover_stale()
+                    last_recovery = time.time()
+                self.run_pending()
+            except Exception as e:
+                app.logger.error(f"后台任务线程异常: {e}")
+            self.wakeup.wait(app.config['JOB_POLL_INTERVAL'])
+            self.wakeup.clear()
+    
+    def stats(self):
+        counts = dict(db.session.query(BackgroundJob.status, func.count(BackgroundJob.id))
+                      .group_by(BackgroundJob.status).all())
+        return {
+            'worker_id': self.worker_id,
+            'workers': len(self.threads),
+            'processed': self.processed,
+            'failed': self.failed,
+            'counts': counts
+        }
+    
+    def shutdown(self):
+        self.stopping.set()
+        self.wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout=5)
+        self.threads = []
+
+job_queue = DurableJobQueue()
+
+@app.before_request
+def resume_background_jobs():
+    job_queue.resume_if_needed()
 
 # ========== 新增的CSV导入功能 ==========
 
+CSV_REQUIRED_COLUMNS = ['ASIN', 'Product Name', 'Price', 'Units Sold (Monthly)', 'Category']
+CSV_IMPORT_BATCH_SIZE = 5000
+CSV_IMPORT_CHUNK_SIZE = 20000
+# 所有列按字符串读取，由clean_frame统一清洗，避免pandas逐块推断类型
+CSV_DTYPES = {col: str for col in CSV_REQUIRED_COLUMNS}
+
+class ProductCSVImporter:
+    """CSV批量导入：向量化清洗、一次性查重、分批executemany插入"""
+    def __init__(self, user_id, batch_size=CSV_IMPORT_BATCH_SIZE):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.existing_names = None
+        self.stats = {'parsed': 0, 'inserted': 0, 'skipped': 0, 'failed': 0}
+    
+    @staticmethod
+    def missing_columns(df):
+        return [col for col in CSV_REQUIRED_COLUMNS if col not in df.columns]
+    
+    @staticmethod
+    def clean_frame(df):
+        """清洗原始CSV数据，返回 (可导入的产品DataFrame, 无法解析的行数)"""
+        price = pd.to_numeric(df['Price'].astype(str).str.replace(r'[$,\s]', '', regex=True), errors='coerce')
+        units = pd.to_numeric(df['Units Sold (Monthly)'].astype(str).str.replace(r'[,\s]', '', regex=True), errors='coerce')
+        names = df['Product Name']
+        valid = price.notna() & units.notna() & names.notna()
+        
+        asin = df['ASIN']
+        product_url = ('https://www.amazon.com/dp/' + asin.astype(str)).where(asin.notna(), '')
+        
+        frame = pd.DataFrame({
+            'name': names.astype(str),
+            'category': df['Category'].fillna('未知类别').astype(str),
+            'current_price': price,
+            'estimated_cost': price * 0.3,  # 假设成本是价格的30%
+            'monthly_sales': units,
+            'competition_level': '中',  # 默认值
+            'review_rating': 4.0,  # 默认值
+            'product_url': product_url
+        })[valid]
+        frame['monthly_sales'] = frame['monthly_sales'].astype(int)
+        return frame, int((~valid).sum())
+    
+    def load_existing_names(self):
+        """一次性加载用户已有产品名称用于查重"""
+        rows = db.session.query(Product.name).filter_by(user_id=self.user_id).all()
+        self.existing_names = {row[0] for row in rows}
+    
+    def insert_frame(self, frame):
+        """查重后分批插入，返回实际插入的DataFrame（不提交事务）"""
+        if self.existing_names is None:
+            self.load_existing_names()
+        
+        fresh = frame[~frame['name'].isin(self.existing_names)].drop_duplicates('name')
+        self.stats['skipped'] += len(frame) - len(fresh)
+        if fresh.empty:
+            return fresh
+        
+        now = datetime.now(timezone.utc)
+        fresh = derive_product_metrics(fresh)
+        fresh['comprehensive_score'] = score_products_vectorized(fresh)
+        records = fresh.assign(user_id=self.user_id, created_at=now, updated_at=now).to_dict('records')
+        for start in range(0, len(records), self.batch_size):
+            db.session.execute(Product.__table__.insert(), records[start:start + self.batch_size])
+        
+        self.existing_names.update(fresh['name'])
+        self.stats['inserted'] += len(fresh)
+        return fresh
+    
+    def import_frame(self, df):
+        """清洗并插入一个原始DataFrame，返回插入的产品DataFrame"""
+        self.stats['parsed'] += len(df)
+        frame, failed = self.clean_frame(df)
+        self.stats['failed'] += failed
+        return self.insert_frame(frame)
+    
+    @staticmethod
+    def _read_options(file_path):
+        # 跳过前2行（文件头），从第3行开始读取数据
+        return {
+            'skiprows': 2,
+            'encoding': 'utf-8',
+            'compression': 'gzip' if file_path.endswith('.gz') else None
+        }
+    
+    @classmethod
+    def read_header(cls, file_path):
+        """只读取表头，用于检查必要列"""
+        return pd.read_csv(file_path, nrows=0, **cls._read_options(file_path))
+    
+    @classmethod
+    def iter_chunks(cls, file_path, chunksize=CSV_IMPORT_CHUNK_SIZE):
+        """按块流式读取CSV（支持gzip），只保留必要列，内存占用与文件大小无关"""
+        return pd.read_csv(
+            file_path,
+            chunksize=chunksize,
+            usecols=lambda col: col in CSV_DTYPES,
+            dtype=CSV_DTYPES,
+            **cls._read_options(file_path)
+        )
+
+def _import_upload_dir():
+    upload_dir = app.config['IMPORT_UPLOAD_DIR'] or os.path.join(app.instance_path, 'uploads')
+    os.makedirs(upload_dir, exist_ok=True)
+    return upload_dir
+
+def _update_import_job(job, importer=None, **fields):
+    """同步导入进度到任务记录并提交"""
+    if importer is not None:
+        job.rows_parsed = importer.stats['parsed']
+        job.rows_inserted = importer.stats['inserted']
+        job.rows_skipped = importer.stats['skipped']
+        job.rows_failed = importer.stats['failed']
+    for key, value in fields.items():
+        setattr(job, key, value)
+    db.session.commit()
+
+def run_import_job(job_id):
+    """后台执行CSV导入任务"""
+    with app.app_context():
+        job = db.session.get(ImportJob, job_id)
+        if not job or job.status != 'queued':
+            return  # 已被 fail_stale_import_jobs 判定为中断
+        importer = ProductCSVImporter(job.user_id)
+        try:
+            _update_import_job(job, status='running', started_at=datetime.now(timezone.utc))
+            
+            missing_columns = ProductCSVImporter.missing_columns(ProductCSVImporter.read_header(job.file_path))
+            if missing_columns:
+                raise ValueError(f'CSV文件缺少必要的列: {missing_columns}')
+            
+            # 逐块清洗、查重、入库，每块提交一次并更新进度
+            for chunk in ProductCSVImporter.iter_chunks(job.file_path):
+                importer.import_frame(chunk)
+                _update_import_job(job, importer)
+                on_products_changed(job.user_id)
+            
+            _update_import_job(job, importer, status='completed', finished_at=datetime.now(timezone.utc),
+                               message=f"成功导入 {importer.stats['inserted']} 个产品")
+            app.logger.info(f"导入任务 {job_id} 完成: {job.to_dict()}")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"导入任务 {job_id} 失败: {e}")
+            _update_import_job(job, importer, status='failed', finished_at=datetime.now(timezone.utc),
+                               message=f'导入失败: {str(e)}')
+        finally:
+            if job.file_path and os.path.exists(job.file_path):
+                os.remove(job.file_path)
+
 @app.route('/api/import-csv', methods=['POST'])
 @login_required
 def api_import_csv():
-    """导入CSV文件数据"""
+    """上传CSV文件并创建后台导入任务，立即返回任务ID"""
+    job_id = file_path = None
+    submitted = False
     try:
-        # 新增的清洗函数
-        def clean_price(price_str):
-            if isinstance(price_str, str):
-                return price_str.replace('$', '').replace(',', '').strip()
-            return price_str
-
         # 获取上传的文件
         if 'csv_file' not in request.files:
             return jsonify({'success': False, 'message': '没有选择文件'})
@@ -802,68 +3309,56 @@ def api_import_csv():
         if file.filename == '':
             return jsonify({'success': False, 'message': '没有选择文件'})
         
-        if not file.filename.endswith('.csv'):
-            return jsonify({'success': False, 'message': '请上传CSV文件'})
-        
-        # 读取CSV文件
-        try:
-            # 跳过前2行（文件头），从第3行开始读取数据
-            df = pd.read_csv(file, skiprows=2, encoding='utf-8')
-        except Exception as e:
-            return jsonify({'success': False, 'message': f'读取CSV文件失败: {str(e)}'})
-        
-        # 检查必要的列是否存在
-        required_columns = ['ASIN', 'Product Name', 'Price', 'Units Sold (Monthly)', 'Category']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            return jsonify({'success': False, 'message': f'CSV文件缺少必要的列: {missing_columns}'})
+        filename = file.filename.lower()
+        if not (filename.endswith('.csv') or filename.endswith('.csv.gz')):
+            return jsonify({'success': False, 'message': '请上传CSV文件（支持 .csv.gz 压缩）'})
         
-        # 导入产品数据
-        imported_count = 0
-        for index, row in df.iterrows():
-            try:
-                # 检查是否已存在相同名称的产品
-                existing_product = Product.query.filter_by(
-                    name=row['Product Name'], 
-                    user_id=session['user_id']
-                ).first()
-                
-                if existing_product:
-                    continue  # 跳过已存在的产品
-                
-                # 创建新产品
-                product = Product(
-                    name=row['Product Name'],
-                    category=row.get('Category', '未知类别'),
-                    current_price=float(clean_price(row['Price'])),
-                    estimated_cost=float(clean_price(row['Price'])) * 0.3,# 假设成本是价格的30%
-                    monthly_sales=int(row['Units Sold (Monthly)']),
-                    competition_level='中',  # 默认值
-                    review_rating=4.0,  # 默认值
-                    product_url=f"https://www.amazon.com/dp/{row['ASIN']}" if pd.notna(row['ASIN']) else '',
-                    user_id=session['user_id']
-                )
-                
-                db.session.add(product)
-                imported_count += 1
-                
-            except Exception as e:
-                app.logger.error(f"导入产品失败 (行 {index+3}): {e}")
-                continue
+        # 暂存上传文件到磁盘，由后台线程解析和入库
+        job_id = secrets.token_hex(16)
+        suffix = '.csv.gz' if filename.endswith('.gz') else '.csv'
+        file_path = os.path.join(_import_upload_dir(), f'{job_id}{suffix}')
+        file.save(file_path)
         
+        job = ImportJob(id=job_id, user_id=session['user_id'], filename=file.filename, file_path=file_path,
+                        worker_id=f"{socket.gethostname()}:{os.getpid()}")
+        db.session.add(job)
         db.session.commit()
+        import_executor.submit(run_import_job, job_id)
+        submitted = True
         
-        app.logger.info(f"用户 {session['username']} 导入 {imported_count} 个产品")
+        app.logger.info(f"用户 {session['username']} 创建导入任务 {job_id}: {file.filename}")
         return jsonify({
-            'success': True, 
-            'message': f'成功导入 {imported_count} 个产品',
-            'imported_count': imported_count
+            'success': True,
+            'message': '文件已上传，正在后台导入',
+            'job_id': job_id,
+            'status_url': url_for('api_import_job_status', job_id=job_id)
         })
         
     except Exception as e:
+        db.session.rollback()
         app.logger.error(f"导入CSV失败: {e}")
+        # 任务未提交到线程池时，清理暂存文件和已写入的任务记录
+        if not submitted and job_id:
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
+            try:
+                ImportJob.query.filter_by(id=job_id, status='queued').update(
+                    {'status': 'failed', 'finished_at': datetime.now(timezone.utc), 'message': f'导入失败: {str(e)}'},
+                    synchronize_session=False)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
         return jsonify({'success': False, 'message': f'导入失败: {str(e)}'})
 
+@app.route('/api/import-jobs/<job_id>')
+@login_required
+def api_import_job_status(job_id):
+    """查询CSV导入任务进度"""
+    job = ImportJob.query.filter_by(id=job_id, user_id=session['user_id']).first()
+    if not job:
+        return jsonify({'error': '导入任务不存在'}), 404
+    return jsonify(job.to_dict())
+
 @app.route('/api/clear-products', methods=['POST'])
 @login_required
 def api_clear_products():
@@ -871,6 +3366,7 @@ def api_clear_products():
     try:
         deleted_count = Product.query.filter_by(user_id=session['user_id']).delete()
         db.session.commit()
+        on_products_changed(session['user_id'], cleared=True)
         
         app.logger.info(f"用户 {session['username']} 清空了 {deleted_count} 个产品")
         return jsonify({
@@ -951,10 +3447,8 @@ def dashboard():
     product_count = Product.query.filter_by(user_id=session['user_id']).count()
     report_count = Report.query.filter_by(user_id=session['user_id']).count()
     
-    # 获取产品统计数据
-    user_products = Product.query.filter_by(user_id=session['user_id']).all()
-    analyzer = AutomationProductAnalyzer(user_products)
-    stats = analyzer.get_detailed_stats()
+    # 获取产品统计数据（版本化快照）
+    stats = get_user_stats(session['user_id'])
     
     app.logger.info(f'用户访问仪表板: {session["username"]}')
     return render_template('dashboard_automation_optimized.html', 
@@ -966,9 +3460,7 @@ def dashboard():
 @app.route('/api/stats')
 @login_required
 def api_stats():
-    user_products = Product.query.filter_by(user_id=session['user_id']).all()
-    analyzer = AutomationProductAnalyzer(user_products)
-    stats = analyzer.get_detailed_stats()
+    stats = get_user_stats(session['user_id'])
     return jsonify(stats)
 
 @app.route('/api/generate-report', methods=['POST'])
@@ -978,32 +3470,65 @@ def api_generate_report():
     try:
         report_type = request.json.get('report_type', 'manual')
         
-        # 在后台生成报告
-        executor.submit(background_generate_report, session['user_id'], report_type)
+        # 写入持久化任务队列；同一用户同类型的排队请求合并为一个任务
+        try:
+            job, coalesced = job_queue.enqueue(
+                'generate_report',
+                {'user_id': session['user_id'], 'report_type': report_type},
+                user_id=session['user_id'],
+                dedup_key=f"generate_report:{session['user_id']}:{report_type}"
+            )
+        except JobQueueFull as e:
+            return jsonify({'success': False, 'message': str(e)}), 429
         
-        app.logger.info(f"用户 {session['username']} 请求生成 {report_type} 报告")
-        return jsonify({'success': True, 'message': '报告生成任务已启动，请稍后查看'})
+        app.logger.info(f"用户 {session['username']} 请求生成 {report_type} 报告 (任务 {job.id}{', 已合并' if coalesced else ''})")
+        return jsonify({
+            'success': True,
+            'message': '已有相同的报告任务在排队，已合并' if coalesced else '报告生成任务已启动，请稍后查看',
+            'job_id': job.id,
+            'coalesced': coalesced,
+            'status_url': url_for('api_jobs')
+        })
         
     except Exception as e:
         app.logger.error(f"生成报告失败: {e}")
         return jsonify({'success': False, 'message': f'生成失败: {str(e)}'})
 
+@app.route('/api/jobs')
+@login_required
+def api_jobs():
+    """获取当前用户最近的后台任务状态"""
+    query = BackgroundJob.query.filter_by(user_id=session['user_id'])
+    status = request.args.get('status')
+    if status:
+        query = query.filter_by(status=status)
+    jobs = query.order_by(BackgroundJob.created_at.desc(), BackgroundJob.id.desc()).limit(20).all()
+    return jsonify({'jobs': [job.to_dict() for job in jobs]})
+
 @app.route('/api/reports')
 @login_required
 def api_reports():
     """获取用户报告列表"""
     try:
-        reports = Report.query.filter_by(user_id=session['user_id']).order_by(Report.generated_at.desc()).limit(10).all()
+        # 只查询摘要列，不加载也不解码完整报告数据
+        rows = db.session.query(
+            Report.id, Report.report_type, Report.generated_at, Report.sent_via_email,
+            *[getattr(Report, column) for column in REPORT_SUMMARY_COLUMNS]
+        ).filter(Report.user_id == session['user_id']) \
+            .order_by(Report.generated_at.desc()).limit(10).all()
         
         reports_data = []
-        for report in reports:
-            report_data = json.loads(report.report_data) if report.report_data else {}
+        for row in rows:
             reports_data.append({
-                'id': report.id,
-                'report_type': report.report_type,
-                'generated_at': report.generated_at.strftime('%Y-%m-%d %H:%M'),
-                'sent_via_email': report.sent_via_email,
-                'summary': f"{report_data.get('total_products', 0)}个产品, 平均ROI: {report_data.get('avg_roi', 0)}%"
+                'id': row.id,
+                'report_type': row.report_type,
+                'generated_at': row.generated_at.strftime('%Y-%m-%d %H:%M'),
+                'sent_via_email': row.sent_via_email,
+                'total_products': row.total_products or 0,
+                'avg_roi': row.avg_roi or 0,
+                'high_value_count': row.high_value_count or 0,
+                'total_revenue': row.total_revenue or 0,
+                'summary': f"{row.total_products or 0}个产品, 平均ROI: {row.avg_roi or 0}%"
             })
         
         return jsonify({'reports': reports_data})
@@ -1012,6 +3537,22 @@ def api_reports():
         app.logger.error(f"获取报告列表失败: {e}")
         return jsonify({'reports': []})
 
+@app.route('/api/reports/<int:report_id>')
+@login_required
+def api_report_detail(report_id):
+    """获取单份报告的完整数据"""
+    report = Report.query.filter_by(id=report_id, user_id=session['user_id']).first()
+    if not report:
+        return jsonify({'error': '报告不存在'}), 404
+    return jsonify({
+        'id': report.id,
+        'report_type': report.report_type,
+        'generated_at': report.generated_at.strftime('%Y-%m-%d %H:%M'),
+        'sent_via_email': report.sent_via_email,
+        'email_sent_at': report.email_sent_at.strftime('%Y-%m-%d %H:%M') if report.email_sent_at else None,
+        'report_data': report.data
+    })
+
 @app.route('/api/system/status')
 @login_required
 def api_system_status():
@@ -1035,7 +3576,13 @@ def api_system_status():
             'status': 'running',
             'scheduler_type': scheduler_status,
             'mail_service': 'Available' if FLASK_MAIL_AVAILABLE else 'Simulated',
-            'background_workers': executor._max_workers,
+            'background_workers': app.config['JOB_WORKERS'],
+            'job_queue': job_queue.stats(),
+            'scheduler_leader': scheduler_leader.status(),
+            'job_metrics': job_metrics.snapshot(),
+            'cache': performance_cache.stats(),
+            'report_runs': report_run_summaries,
+            'report_retention': report_retention_stats,
             'server_time': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
             'scheduled_jobs': jobs
         }
@@ -1051,16 +3598,10 @@ def api_system_status():
 def api_products_overview():
     """获取产品概览数据"""
     try:
-        user_products = Product.query.filter_by(user_id=session['user_id']).all()
-        analyzer = AutomationProductAnalyzer(user_products)
-        stats = analyzer.get_detailed_stats()
+        stats = get_user_stats(session['user_id'])
         
-        # 添加实时产品数据
-        products_data = []
-        for product in user_products[:5]:  # 只返回前5个产品
-            product_dict = product.to_dict()
-            product_dict['comprehensive_score'] = analyzer.calculate_comprehensive_score(product_dict)
-            products_data.append(product_dict)
+        # 综合评分最高的5个产品（走评分索引，ORDER BY ... LIMIT）
+        products_data = query_top_products(session['user_id'], k=5, by='score')
         
         overview = {
             'basic_stats': {
@@ -1069,7 +3610,7 @@ def api_products_overview():
                 'total_revenue': stats['total_revenue'],
                 'high_value_count': stats['high_value_count']
             },
-            'recent_products': products_data,
+            'top_products': products_data,
             'category_distribution': stats['category_breakdown'],
             'performance_metrics': {
                 'profit_potential': stats['profit_analysis']['total_profit_potential'],
@@ -1085,21 +3626,155 @@ def api_products_overview():
         return jsonify({'error': str(e)})
 
 # 其他产品管理路由
+PRODUCT_PAGE_DEFAULT_LIMIT = 50
+PRODUCT_PAGE_MAX_LIMIT = 500
+PRODUCT_LIST_COLUMNS = [
+    Product.id, Product.name, Product.category, Product.current_price, Product.estimated_cost,
+    Product.monthly_sales, Product.competition_level, Product.review_rating, Product.product_url,
+    Product.estimated_profit, Product.estimated_roi, Product.revenue_potential, Product.comprehensive_score,
+    Product.created_at, Product.updated_at
+]
+PRODUCT_LIST_FIELDS = {column.key: column for column in PRODUCT_LIST_COLUMNS}
+PRODUCT_SORT_COLUMNS = {
+    'score': Product.comprehensive_score,
+    'roi': Product.estimated_roi,
+    'revenue': Product.revenue_potential
+}
+
+def _encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def _is_number(value, integral=False):
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, int) if integral else isinstance(value, (int, float)) and math.isfinite(value)
+
+def _decode_cursor(cursor, sort='id'):
+    """解码并校验游标：sort=id 时为整数id，其余为 [数值或null, 整数id]，格式不符抛出ValueError"""
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    if sort == 'id':
+        if not _is_number(values, integral=True):
+            raise ValueError('invalid cursor')
+        return values
+    if not (isinstance(values, list) and len(values) == 2
+            and (values[0] is None or _is_number(values[0])) and _is_number(values[1], integral=True)):
+        raise ValueError('invalid cursor')
+    return values
+
+def _product_rows_to_dicts(rows):
+    """把列查询结果转换为与Product.to_dict相同格式的字典"""
+    if not rows:
+        return []
+    page = pd.DataFrame.from_records(rows, columns=list(rows[0]._fields))
+    if {'current_price', 'estimated_cost', 'monthly_sales', 'competition_level', 'review_rating'} <= set(page.columns):
+        page = fill_missing_derived_metrics(page)
+    for column in ('created_at', 'updated_at'):
+        if column in page:
+            page[column] = pd.to_datetime(page[column]).dt.strftime('%Y-%m-%d %H:%M')
+    return page.to_dict('records')
+
 @app.route('/api/products')
 @login_required
 def api_products():
-    user_products = Product.query.filter_by(user_id=session['user_id']).all()
+    """分页查询产品：游标分页（按id键集），支持排序、类别/竞争程度筛选和字段投影
+    
+    参数: limit, cursor, sort=id|score|roi|revenue, fields=a,b,c, category, competition_level
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', PRODUCT_PAGE_DEFAULT_LIMIT)), 1), PRODUCT_PAGE_MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit 必须是整数'}), 400
     
-    products_data = []
-    analyzer = AutomationProductAnalyzer(user_products)
+    sort = request.args.get('sort', 'id')
+    if sort != 'id' and sort not in PRODUCT_SORT_COLUMNS:
+        return jsonify({'error': f'不支持的排序字段: {sort}'}), 400
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+    projected = bool(fields)
     
-    for product in user_products:
-        product_dict = product.to_dict()
-        product_dict['comprehensive_score'] = analyzer.calculate_comprehensive_score(product_dict)
-        products_data.append(product_dict)
+    # 字段投影下推到查询：只选取id、请求的字段（忽略未知字段）和生成游标所需的排序列
+    columns = PRODUCT_LIST_COLUMNS
+    if projected:
+        fields = [field for field in dict.fromkeys(fields) if field in PRODUCT_LIST_FIELDS and field != 'id']
+        selected = ['id'] + fields
+        if sort != 'id' and PRODUCT_SORT_COLUMNS[sort].key not in selected:
+            selected.append(PRODUCT_SORT_COLUMNS[sort].key)
+        columns = [PRODUCT_LIST_FIELDS[key] for key in selected]
     
-    app.logger.info(f'产品数据查询: 用户={session["username"]}, 结果数={len(products_data)}')
-    return jsonify({'products': products_data})
+    query = db.session.query(*columns).filter(Product.user_id == session['user_id'])
+    for name in ('category', 'competition_level'):
+        value = request.args.get(name)
+        if value:
+            query = query.filter(getattr(Product, name) == value)
+    
+    cursor = request.args.get('cursor')
+    try:
+        if sort == 'id':
+            if cursor:
+                query = query.filter(Product.id > _decode_cursor(cursor))
+            query = query.order_by(Product.id)
+        else:
+            # 排序列可为空（尚未回填的旧数据）：空值排在最后，键集条件同样显式处理空值
+            sort_column = PRODUCT_SORT_COLUMNS[sort]
+            if cursor:
+                last_value, last_id = _decode_cursor(cursor, sort)
+                if last_value is None:
+                    query = query.filter(sort_column.is_(None), Product.id > last_id)
+                else:
+                    query = query.filter(or_(
+                        sort_column < last_value,
+                        and_(sort_column == last_value, Product.id > last_id),
+                        sort_column.is_(None)
+                    ))
+            query = query.order_by(sort_column.desc().nulls_last(), Product.id)
+    except (ValueError, TypeError):
+        return jsonify({'error': '无效的分页游标'}), 400
+    
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = _encode_cursor(last.id if sort == 'id' else [getattr(last, PRODUCT_SORT_COLUMNS[sort].key), last.id])
+    
+    products_data = _product_rows_to_dicts(rows)
+    if projected:
+        products_data = [{key: product[key] for key in ['id'] + fields} for product in products_data]
+    
+    app.logger.info(f'产品数据查询: 用户={session["username"]}, 排序={sort}, 结果数={len(products_data)}')
+    return jsonify({
+        'products': products_data,
+        'next_cursor': next_cursor,
+        'has_more': has_more,
+        'limit': limit,
+        'sort': sort
+    })
+
+TOP_PRODUCTS_MAX_K = 100
+
+def query_top_products(user_id, k=5, by='score'):
+    """按指定指标取前k个产品，利用 (user_id, 指标) 索引避免全表排序"""
+    sort_column = PRODUCT_SORT_COLUMNS[by]
+    rows = db.session.query(*PRODUCT_LIST_COLUMNS) \
+        .filter(Product.user_id == user_id) \
+        .order_by(sort_column.desc().nulls_last(), Product.id) \
+        .limit(k).all()
+    return _product_rows_to_dicts(rows)
+
+@app.route('/api/products/top')
+@login_required
+def api_products_top():
+    """获取最佳的前k个产品，参数: k（默认5，最大100）, by=score|roi|revenue"""
+    try:
+        k = min(max(int(request.args.get('k', 5)), 1), TOP_PRODUCTS_MAX_K)
+    except ValueError:
+        return jsonify({'error': 'k 必须是整数'}), 400
+    by = request.args.get('by', 'score')
+    if by not in PRODUCT_SORT_COLUMNS:
+        return jsonify({'error': f'不支持的排序指标: {by}'}), 400
+    
+    return jsonify({'by': by, 'k': k, 'products': query_top_products(session['user_id'], k=k, by=by)})
 
 @app.route('/add_product', methods=['POST'])
 @login_required
@@ -1128,6 +3803,7 @@ def add_product():
         
         db.session.add(product)
         db.session.commit()
+        on_products_changed(session['user_id'])
         
         app.logger.info(f'产品添加成功: {name}, 用户: {session["username"]}')
         return jsonify({'success': True, 'message': '产品添加成功！'})
@@ -1665,7 +4341,7 @@ def create_optimized_templates():
                     
                     <!-- 添加导入功能 -->
                     <div style="margin-bottom: 20px; display: flex; gap: 10px;">
-                        <input type="file" id="csvFile" accept=".csv" style="display: none;">
+                        <input type="file" id="csvFile" accept=".csv,.gz" style="display: none;">
                         <button class="btn btn-success" onclick="document.getElementById('csvFile').click()">
                             📁 导入CSV文件
                         </button>
@@ -1694,6 +4370,9 @@ def create_optimized_templates():
                                 <!-- 产品数据将通过JavaScript动态加载 -->
                             </tbody>
                         </table>
+                        <div style="text-align: center; margin-top: 15px;">
+                            <button class="btn" id="loadMoreProducts" onclick="loadProductList(true)" style="display: none;">⬇️ 加载更多</button>
+                        </div>
                     </div>
                 </div>
 
@@ -1885,10 +4564,15 @@ def create_optimized_templates():
             }
         }
 
-        // 加载产品列表 - 新增函数
-        async function loadProductList() {
+        // 加载产品列表（分页，append为true时加载下一页）
+        let productCursor = null;
+        async function loadProductList(append = false) {
             try {
-                const response = await fetch('/api/products');
+                let url = '/api/products?limit=50&fields=name,category,current_price,monthly_sales,product_url';
+                if (append && productCursor) {
+                    url += `&cursor=${encodeURIComponent(productCursor)}`;
+                }
+                const response = await fetch(url);
                 const data = await response.json();
                 
                 let productHtml = '';
@@ -1908,11 +4592,18 @@ def create_optimized_templates():
                             </tr>
                         `;
                     });
-                } else {
+                } else if (!append) {
                     productHtml = '<tr><td colspan="5" style="padding: 20px; text-align: center; color: #6c757d;">暂无产品数据</td></tr>';
                 }
                 
-                document.getElementById('productTableBody').innerHTML = productHtml;
+                const tableBody = document.getElementById('productTableBody');
+                if (append) {
+                    tableBody.insertAdjacentHTML('beforeend', productHtml);
+                } else {
+                    tableBody.innerHTML = productHtml;
+                }
+                productCursor = data.next_cursor;
+                document.getElementById('loadMoreProducts').style.display = data.has_more ? 'inline-block' : 'none';
             } catch (error) {
                 console.error('加载产品列表失败:', error);
                 document.getElementById('productTableBody').innerHTML = '<tr><td colspan="5" style="padding: 20px; text-align: center; color: #dc3545;">加载失败</td></tr>';
@@ -1943,12 +4634,8 @@ def create_optimized_templates():
                 const result = await response.json();
                 
                 if (result.success) {
-                    statusDiv.innerHTML = `<div style="color: #28a745;">✅ ${result.message}</div>`;
-                    // 导入成功后刷新产品列表
-                    setTimeout(() => {
-                        loadProductList();
-                        loadStatsOverview();
-                    }, 1000);
+                    statusDiv.innerHTML = `<div style="color: #007bff;">🔄 ${result.message}</div>`;
+                    pollImportJob(result.job_id);
                 } else {
                     statusDiv.innerHTML = `<div style="color: #dc3545;">❌ ${result.message}</div>`;
                 }
@@ -1960,6 +4647,32 @@ def create_optimized_templates():
             document.getElementById('csvFile').value = '';
         }
 
+        // 轮询导入任务进度
+        async function pollImportJob(jobId) {
+            const statusDiv = document.getElementById('importStatus');
+            try {
+                const response = await fetch(`/api/import-jobs/${jobId}`);
+                const job = await response.json();
+                
+                if (job.status === 'completed') {
+                    statusDiv.innerHTML = `<div style="color: #28a745;">✅ ${job.message}（跳过 ${job.rows_skipped}，失败 ${job.rows_failed}）</div>`;
+                    // 导入成功后刷新产品列表
+                    loadProductList();
+                    loadStatsOverview();
+                } else if (job.status === 'failed') {
+                    statusDiv.innerHTML = `<div style="color: #dc3545;">❌ ${job.message}</div>`;
+                } else if (job.error) {
+                    statusDiv.innerHTML = `<div style="color: #dc3545;">❌ ${job.error}</div>`;
+                } else {
+                    const speed = job.rows_per_second ? `，${job.rows_per_second} 行/秒` : '';
+                    statusDiv.innerHTML = `<div style="color: #007bff;">🔄 已解析 ${job.rows_parsed} 行，已导入 ${job.rows_inserted} 个产品${speed}</div>`;
+                    setTimeout(() => pollImportJob(jobId), 1000);
+                }
+            } catch (error) {
+                statusDiv.innerHTML = `<div style="color: #dc3545;">❌ 查询导入进度失败: ${error}</div>`;
+            }
+        }
+
         // 清空产品功能
         async function clearProducts() {
             if (!confirm('确定要清空所有产品数据吗？此操作不可撤销！')) {
@@ -2082,6 +4795,14 @@ def health_check():
     """
     return {'status': 'healthy', 'service': 'Automation System', 'timestamp': datetime.datetime.utcnow().isoformat()}, 200
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus 文本格式的定时任务指标（配置 METRICS_TOKEN 后需携带 Bearer 令牌）"""
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return 'unauthorized\n', 401, {'Content-Type': 'text/plain; charset=utf-8'}
+    return job_metrics.to_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 if __name__ == '__main__':
     # 设置日志
     setup_logging()
@@ -2122,5 +4843,6 @@ if __name__ == '__main__':
         print("\n🛑 正在关闭系统...")
         if hasattr(scheduler, 'shutdown'):
             scheduler.shutdown()
-        executor.shutdown(wait=False)
+        scheduler_leader.release()
+        job_queue.shutdown()
         print("✅ 系统已安全关闭")
\ No newline at end of file
@@ -0,0 +1,9 @@
+"""测试环境：导入应用模块前把数据库和上传目录指向临时目录"""
+import os
+import sys
+import tempfile
+
+_DB_DIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_DB_DIR, "test.db")}'
+os.environ['IMPORT_UPLOAD_DIR'] = os.path.join(_DB_DIR, 'uploads')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
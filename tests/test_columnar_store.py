@@ -0,0 +1,125 @@
+"""列式产品缓存与聚合的并发测试：追加写入时不修改读者可能正在使用的已发布实例"""
+import threading
+
+import lesson_13_fixed as app_module
+
+app = app_module.app
+db = app_module.db
+Product = app_module.Product
+User = app_module.User
+
+
+def _demo_user_id():
+    app_module.add_sample_data()
+    with app.app_context():
+        return User.query.filter_by(username='demo').first().id
+
+
+def test_append_does_not_mutate_published_columns():
+    user_id = _demo_user_id()
+    store = app_module.ColumnarProductStore()
+    with app.app_context():
+        published = store.get(user_id)
+        before = len(published)
+        old_version = app_module.product_versions.get(user_id)
+        product = Product(name='追加产品', category='新类别', current_price=20.0, estimated_cost=5.0,
+                          monthly_sales=100, competition_level='低', review_rating=4.5, user_id=user_id)
+        db.session.add(product)
+        db.session.commit()
+        new_version = app_module.product_versions.bump(user_id)
+        store.apply_change(user_id, old_version, new_version)
+
+        assert len(published) == before
+        assert '新类别' not in published.categories
+        updated = store.get(user_id)
+        assert updated is not published
+        assert len(updated) == before + 1
+        assert updated.to_frame()['category'].iloc[-1] == '新类别'
+
+
+def test_concurrent_append_and_to_frame():
+    user_id = _demo_user_id()
+    store = app_module.ColumnarProductStore()
+    with app.app_context():
+        store.get(user_id)
+
+    stop = threading.Event()
+    errors = []
+
+    def reader():
+        while not stop.is_set():
+            with store._lock:
+                columns = store._columns.get(user_id)
+            if columns is None:
+                continue
+            try:
+                frame = columns.to_frame()
+                lengths = {len(columns.ids), len(columns.names), len(columns.category_codes),
+                           len(columns.competition_codes)} | {len(values) for values in columns.numeric.values()}
+                assert len(lengths) == 1, lengths
+                assert len(frame) == len(columns.ids)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+
+    def writer():
+        with app.app_context():
+            for i in range(40):
+                old_version = app_module.product_versions.get(user_id)
+                db.session.add(Product(name=f'并发产品{i}', category=f'类别{i % 5}', current_price=10.0 + i,
+                                       estimated_cost=4.0, monthly_sales=50 + i, competition_level='中',
+                                       review_rating=4.0, user_id=user_id))
+                db.session.commit()
+                new_version = app_module.product_versions.bump(user_id)
+                store.apply_change(user_id, old_version, new_version)
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    try:
+        writer()
+    finally:
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+    assert not errors, errors
+    with app.app_context():
+        expected = Product.query.filter_by(user_id=user_id).count()
+        assert len(store.get(user_id).to_frame()) == expected
+
+
+def _add_product(user_id, name, category):
+    db.session.add(Product(name=name, category=category, current_price=30.0, estimated_cost=10.0,
+                           monthly_sales=400, competition_level='低', review_rating=4.6, user_id=user_id))
+    db.session.commit()
+
+
+def test_aggregate_append_does_not_mutate_published_aggregates():
+    user_id = _demo_user_id()
+    with app.app_context():
+        published = app_module.aggregate_store.get(user_id)
+        stats_before = published.to_stats()
+        _add_product(user_id, '聚合产品', '聚合类别')
+        app_module.on_products_changed(user_id)
+
+        assert published.to_stats() == stats_before
+        assert '聚合类别' not in published.categories
+        updated = app_module.aggregate_store.get(user_id)
+        assert updated is not published
+        assert updated.count == published.count + 1
+        assert '聚合类别' in updated.categories
+
+
+def test_rebuild_between_commit_and_version_bump_is_not_double_counted():
+    user_id = _demo_user_id()
+    with app.app_context():
+        app_module.aggregate_store.apply_change(user_id, None, None, cleared=True)  # 丢弃，模拟进程内首次访问
+        _add_product(user_id, '窗口期产品', '窗口类别')
+        # 提交后、版本号递增前的统计请求：按旧版本号重建，已包含新行
+        app_module.aggregate_store.get(user_id)
+        app_module.on_products_changed(user_id)
+
+        expected = Product.query.filter_by(user_id=user_id).count()
+        assert app_module.aggregate_store.get(user_id).count == expected
+        assert app_module.get_user_stats(user_id)['total_products'] == expected
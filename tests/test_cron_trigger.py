@@ -0,0 +1,99 @@
+"""SimpleCronTrigger：APScheduler风格关键字参数、crontab表达式、日/星期匹配与夏令时"""
+from datetime import datetime, timezone
+
+import pytest
+
+import lesson_13_fixed as app_module
+
+SimpleCronTrigger = app_module.SimpleCronTrigger
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def fire_times(trigger, after, count):
+    times = []
+    for _ in range(count):
+        after = trigger.next_fire_time(after)
+        times.append(after)
+    return times
+
+
+def test_weekly_kwargs_use_apscheduler_weekdays():
+    # day_of_week=0 是周一（APScheduler），未指定的分钟取0
+    trigger = SimpleCronTrigger.from_kwargs(day_of_week=0, hour=10)
+    assert fire_times(trigger, utc(2026, 10, 14, 12, 0), 2) == [utc(2026, 10, 19, 10, 0), utc(2026, 10, 26, 10, 0)]
+
+
+def test_weekly_expression_uses_crontab_weekdays():
+    # crontab 中 0 和 7 都是周日
+    for expression in ('0 10 * * 0', '0 10 * * 7', '0 10 * * sun'):
+        trigger = SimpleCronTrigger.from_kwargs(expression=expression)
+        assert trigger.next_fire_time(utc(2026, 10, 14, 12, 0)) == utc(2026, 10, 18, 10, 0)
+
+
+def test_kwargs_defaults_lower_fields_to_minimum():
+    assert fire_times(SimpleCronTrigger.from_kwargs(hour=9), utc(2026, 10, 14, 9, 0), 2) == \
+        [utc(2026, 10, 15, 9, 0), utc(2026, 10, 16, 9, 0)]
+    assert fire_times(SimpleCronTrigger.from_kwargs(minute='*/15'), utc(2026, 10, 14, 9, 7), 3) == \
+        [utc(2026, 10, 14, 9, 15), utc(2026, 10, 14, 9, 30), utc(2026, 10, 14, 9, 45)]
+    assert SimpleCronTrigger.from_kwargs(day=1).next_fire_time(utc(2026, 10, 14)) == utc(2026, 11, 1, 0, 0)
+
+
+def test_next_fire_time_is_strictly_after():
+    trigger = SimpleCronTrigger.from_kwargs(hour=9, minute=30)
+    assert trigger.next_fire_time(utc(2026, 10, 14, 9, 30)) == utc(2026, 10, 15, 9, 30)
+    assert trigger.next_fire_time(utc(2026, 10, 14, 9, 29, 59)) == utc(2026, 10, 14, 9, 30)
+
+
+def test_expression_day_and_weekday_match_either():
+    # crontab：日和星期同时限定时满足其一即可（每月1日或每周一）
+    trigger = SimpleCronTrigger.from_kwargs(expression='0 0 1 * mon')
+    assert fire_times(trigger, utc(2026, 10, 27), 3) == [utc(2026, 11, 1), utc(2026, 11, 2), utc(2026, 11, 9)]
+
+
+def test_kwargs_day_and_weekday_must_both_match():
+    # APScheduler：日和星期需同时满足（既是1日又是周一）
+    trigger = SimpleCronTrigger.from_kwargs(day=1, day_of_week='mon')
+    assert trigger.next_fire_time(utc(2026, 10, 2)) == utc(2027, 2, 1)
+
+
+def test_weekday_ranges_and_names():
+    trigger = SimpleCronTrigger.from_kwargs(day_of_week='mon-fri', hour=8)
+    # 2026-10-16 是周五，下一次为周一
+    assert trigger.next_fire_time(utc(2026, 10, 16, 9)) == utc(2026, 10, 19, 8)
+    assert SimpleCronTrigger.from_kwargs(month='feb', day=29).next_fire_time(utc(2026, 10, 1)) == utc(2028, 2, 29)
+
+
+def test_timezone_is_applied():
+    trigger = SimpleCronTrigger.from_kwargs(hour=10, timezone='Asia/Shanghai')
+    assert trigger.next_fire_time(utc(2026, 10, 14, 3)) == utc(2026, 10, 15, 2)
+
+
+def test_dst_gap_skips_nonexistent_local_time():
+    # 2026-03-08 02:00-03:00 在纽约不存在，02:30 的任务当天跳过
+    trigger = SimpleCronTrigger.from_kwargs(expression='30 2 * * *', timezone='America/New_York')
+    assert fire_times(trigger, utc(2026, 3, 7, 8), 2) == [utc(2026, 3, 9, 6, 30), utc(2026, 3, 10, 6, 30)]
+    # 跳过的只是不存在的时刻，同一天其他时间正常触发
+    hourly = SimpleCronTrigger.from_kwargs(minute=30, timezone='America/New_York')
+    assert fire_times(hourly, utc(2026, 3, 8, 6, 0), 2) == [utc(2026, 3, 8, 6, 30), utc(2026, 3, 8, 7, 30)]
+
+
+def test_dst_overlap_fires_once():
+    # 2026-11-01 01:30 在纽约出现两次，只在第一次触发
+    trigger = SimpleCronTrigger.from_kwargs(hour=1, minute=30, timezone='America/New_York')
+    assert fire_times(trigger, utc(2026, 11, 1, 4), 2) == [utc(2026, 11, 1, 5, 30), utc(2026, 11, 2, 6, 30)]
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'expression': '0 10 * *'},
+    {'second': 0},
+    {'hour': 24},
+    {'minute': '*/0'},
+    {'day': '10-5'},
+    {'day_of_week': 7},
+])
+def test_invalid_specs_raise(kwargs):
+    with pytest.raises(ValueError):
+        SimpleCronTrigger.from_kwargs(**kwargs)
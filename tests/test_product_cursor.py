@@ -0,0 +1,84 @@
+"""产品列表游标分页：游标编解码校验，以及排序列为空时的分页完整性"""
+import pytest
+
+import lesson_13_fixed as app_module
+
+app = app_module.app
+db = app_module.db
+Product = app_module.Product
+User = app_module.User
+
+encode = app_module._encode_cursor
+decode = app_module._decode_cursor
+
+
+def test_cursor_round_trip():
+    assert decode(encode(42)) == 42
+    assert decode(encode([87.5, 3]), 'score') == [87.5, 3]
+    assert decode(encode([None, 3]), 'roi') == [None, 3]
+
+
+@pytest.mark.parametrize('sort, values', [
+    ('id', '5'),
+    ('id', 5.5),
+    ('id', True),
+    ('score', ['10', 5]),
+    ('score', [True, 5]),
+    ('score', [1.5, '5']),
+    ('score', [1.5]),
+    ('score', 5),
+])
+def test_cursor_rejects_wrong_types(sort, values):
+    with pytest.raises(ValueError):
+        decode(encode(values), sort)
+
+
+def test_cursor_rejects_garbage():
+    with pytest.raises(ValueError):
+        decode('%%%')
+
+
+@pytest.fixture
+def client_with_null_scores():
+    """用户的产品中一部分尚未回填派生指标（排序列为空）"""
+    with app.app_context():
+        user = User.query.filter_by(username='cursor').first()
+        if user is None:
+            user = User(username='cursor', email='cursor@example.com')
+            user.set_password('cursor123')
+            db.session.add(user)
+            db.session.commit()
+        Product.query.filter_by(user_id=user.id).delete()
+        for i in range(7):
+            db.session.add(Product(name=f'游标产品{i}', category='测试', current_price=10.0 + i * 3,
+                                   estimated_cost=5.0, monthly_sales=100 + i * 50, competition_level='中',
+                                   review_rating=4.0, user_id=user.id))
+        db.session.commit()
+        # 模拟旧数据：清空部分行的派生指标
+        ids = [product.id for product in Product.query.filter_by(user_id=user.id).order_by(Product.id)]
+        Product.query.filter(Product.id.in_(ids[::2])).update(
+            {column: None for column in app_module.DERIVED_METRIC_COLUMNS}, synchronize_session=False)
+        db.session.commit()
+    client = app.test_client()
+    client.post('/login', data={'username': 'cursor', 'password': 'cursor123'})
+    return client, ids
+
+
+@pytest.mark.parametrize('sort', ['score', 'roi', 'revenue'])
+def test_pagination_includes_rows_with_null_sort_column(client_with_null_scores, sort):
+    client, ids = client_with_null_scores
+    seen = []
+    cursor = None
+    while True:
+        url = f'/api/products?sort={sort}&limit=2' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200, response.get_json()
+        page = response.get_json()
+        seen += [product['id'] for product in page['products']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert sorted(seen) == ids
+    assert len(seen) == len(set(seen))
+    # 已有指标的行按降序在前，空值行按id排在最后
+    assert seen[-len(ids[::2]):] == ids[::2]
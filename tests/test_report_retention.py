@@ -0,0 +1,91 @@
+"""报告保留与汇总：日报汇总为周汇总、周汇总再汇总为月汇总，计数与合计守恒"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import lesson_13_fixed as app_module
+
+app = app_module.app
+db = app_module.db
+Report = app_module.Report
+User = app_module.User
+
+NOW = datetime(2026, 10, 16, 12, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def retention_user():
+    """2025年1-3月每天一份日报（total_products 等于当天日期序号），另有一份近期日报"""
+    with app.app_context():
+        Report.query.delete()
+        user = User.query.filter_by(username='retention').first()
+        if user is None:
+            user = User(username='retention', email='retention@example.com')
+            user.set_password('retention123')
+            db.session.add(user)
+            db.session.commit()
+        day = datetime(2025, 1, 1, 12)
+        while day < datetime(2025, 4, 1):
+            report = Report(user_id=user.id, report_type='daily', generated_at=day)
+            report.set_data({'total_products': day.timetuple().tm_yday, 'avg_roi': float(day.day),
+                             'high_value_count': 1, 'total_revenue': 10.0})
+            db.session.add(report)
+            day += timedelta(days=1)
+        recent = Report(user_id=user.id, report_type='daily', generated_at=datetime(2026, 10, 15, 12))
+        recent.set_data({'total_products': 1, 'avg_roi': 1.0, 'high_value_count': 0, 'total_revenue': 1.0})
+        db.session.add(recent)
+        db.session.commit()
+        yield user.id
+        Report.query.delete()
+        db.session.commit()
+
+
+def _rollups(user_id, report_type):
+    return {report.period: report.data for report in
+            Report.query.filter_by(user_id=user_id, report_type=report_type).all()}
+
+
+def test_weeks_spanning_months_are_split(retention_user):
+    app.config['REPORT_RETENTION_WEEKLY_DAYS'] = 100000  # 只执行日报 -> 周汇总
+    try:
+        with app.app_context():
+            app_module.compact_reports(now=NOW)
+            weekly = _rollups(retention_user, 'weekly_rollup')
+    finally:
+        app.config['REPORT_RETENTION_WEEKLY_DAYS'] = app_module.Config.REPORT_RETENTION_WEEKLY_DAYS
+    
+    # 2025-W05 为 1月27日-2月2日
+    assert weekly['2025-W05-01']['reports'] == 5
+    assert weekly['2025-W05-02']['reports'] == 2
+    assert '2025-W05' not in weekly
+    assert weekly['2025-W03']['reports'] == 7
+    assert sum(data['reports'] for data in weekly.values()) == 90
+
+
+def test_monthly_rollups_count_each_day_in_its_month(retention_user):
+    with app.app_context():
+        stats = app_module.compact_reports(now=NOW)
+        monthly = _rollups(retention_user, 'monthly_rollup')
+        remaining = Report.query.filter_by(user_id=retention_user).count()
+    
+    assert stats['stages']['weekly_rollup']['rows_deleted'] == 90
+    assert {period: data['reports'] for period, data in monthly.items()} == \
+        {'2025-01': 31, '2025-02': 28, '2025-03': 31}
+    assert monthly['2025-01']['sums']['total_products'] == sum(range(1, 32))
+    assert monthly['2025-03']['sums']['total_products'] == sum(range(60, 91))
+    assert monthly['2025-02']['roi_min'] == 1.0 and monthly['2025-02']['roi_max'] == 28.0
+    assert monthly['2025-01']['period_start'].startswith('2025-01-01')
+    assert monthly['2025-01']['period_end'].startswith('2025-01-31')
+    assert remaining == 3 + 1  # 三份月汇总 + 近期日报
+
+
+def test_compaction_is_idempotent(retention_user):
+    with app.app_context():
+        app_module.compact_reports(now=NOW)
+        first = _rollups(retention_user, 'monthly_rollup')
+        stats = app_module.compact_reports(now=NOW)
+        second = _rollups(retention_user, 'monthly_rollup')
+    
+    assert stats['rows_deleted'] == 0
+    assert {period: data['reports'] for period, data in second.items()} == \
+        {period: data['reports'] for period, data in first.items()}